@@ -1,66 +1,130 @@
 import pandas as pd
 import glob
 import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
-# Define the folders to process
-folders = ['VR', 'Desktop']
+import instrumentation
+from instrumentation import stage
+from probe_data import folders, participant_id
+from reaction_time_decomposition import add_reaction_time_components
 
-participantsPerGroup = 23
+# Define the groups to process, one folder per display environment or session; more can be passed on the command line
+groups = folders
 
-# Check if results.csv exists and delete it if it does
-if os.path.exists('combined_results.csv'):
-    os.remove('combined_results.csv')
 
-# Process the csv files in each folder
-for folder in folders:
-    # Initialize an empty list to store the dataframes
-    dfs = []
-
-    # Get a list of all .csv files in the folder that do not contain '_probe' in the filename and is not 'Participants.csv'
+# Get a list of all .csv files in the folder that do not contain '_probe' in the filename and are not 'trials.csv',
+# sorted considering filenames as integers
+def list_result_files(folder):
     csv_files = [f for f in glob.glob(f'{folder}/*.csv') if '_probe' not in f and 'trials.csv' not in f]
-
-    # Sort the files considering filenames as integers
     csv_files.sort(key=lambda x: int(os.path.splitext(os.path.basename(x))[0]))
+    return csv_files
 
-    # Read each file, strip leading/trailing spaces from column names, and concatenate them into one DataFrame
-    for file in csv_files:
-        df = pd.read_csv(file)
-        df.rename(columns=lambda x: x.strip(), inplace=True)
-        df['Rendering'] = folder  # Add the 'Rendering' column
-        dfs.append(df)
-
-    # Concatenate all the dataframes
-    combined_df = pd.concat(dfs)
-
-    # Convert the Start Timestamp and End Timestamp columns to datetime
-    combined_df['Start Timestamp'] = pd.to_datetime(combined_df['Start Timestamp'])
-    combined_df['End Timestamp'] = pd.to_datetime(combined_df['End Timestamp'])
-
-    # Create a new column Reaction Time which is the difference of End Timestamp and Start Timestamp
-    combined_df['Reaction Time'] = (combined_df['End Timestamp'] - combined_df['Start Timestamp']).dt.total_seconds()
 
-    # Load the trials.csv into a DataFrame
-    trials_df = pd.read_csv('trials.csv').rename(columns=lambda x: x.strip())  # strip spaces from this df too
-
-    # Merge the combined_df and trials_df on "Participant ID" and "Trial Number"
-    merge_columns = ['Participant ID', 'Trial Number']
-    combined_df = pd.merge(combined_df, trials_df[merge_columns + ['Sample Number', 'Sample Order', 'Sample Time', 'Comparison Time', 'Condition', 'Path', 'Foil']],
-                          on=merge_columns, how='left')
-
-    # Sort the combined_df by "Participant ID", "Trial Number", and "End Timestamp" in descending order
-    combined_df.sort_values(by=['Participant ID', 'Trial Number', 'End Timestamp'], ascending=[True, True, False], inplace=True)
-
-    # Drop duplicates based on "Participant ID" and "Trial Number", keeping the first occurrence (latest row)
-    combined_df.drop_duplicates(subset=['Participant ID', 'Trial Number'], keep='first', inplace=True)
-
-    # In order to get unique Participant IDs for each group, add the number of participants per group to the Participant ID for the Desktop group
-    if folder == 'Desktop':  # Check if the folder is 'Desktop'
-            combined_df['Participant ID'] = combined_df['Participant ID'] + participantsPerGroup  
-
-    # Append the combined DataFrame to the results.csv file
-    if os.path.isfile('combined_results.csv') and os.path.getsize('combined_results.csv') > 0:
-        # If the file exists and is not empty, write without header and leading newline
-        combined_df.to_csv('combined_results.csv', mode='a', header=False, index=False)
-    else:
-        # If the file does not exist or is empty, write with header
-        combined_df.to_csv('combined_results.csv', mode='a', header=True, index=False)
\ No newline at end of file
+# Combine the result files of one folder with trials.csv and the probe data of the same participants
+# Also used by watch.py to rebuild the rows of single participants
+def combine_folder(folder, csv_files):
+    dfs = []
+    with stage(f'ingest/read {folder}') as record:
+        # Read each file, strip leading/trailing spaces from column names, and concatenate them into one DataFrame
+        for file in csv_files:
+            df = pd.read_csv(file)
+            df.rename(columns=lambda x: x.strip(), inplace=True)
+            df['Rendering'] = folder  # Add the 'Rendering' column
+            dfs.append(df)
+
+        # Concatenate all the dataframes
+        combined_df = pd.concat(dfs)
+        record['Rows'] = len(combined_df)
+
+    with stage(f'ingest/timestamps {folder}', rows=len(combined_df)):
+        # Convert the Start Timestamp and End Timestamp columns to datetime
+        combined_df['Start Timestamp'] = pd.to_datetime(combined_df['Start Timestamp'])
+        combined_df['End Timestamp'] = pd.to_datetime(combined_df['End Timestamp'])
+
+        # Create a new column Reaction Time which is the difference of End Timestamp and Start Timestamp
+        combined_df['Reaction Time'] = (combined_df['End Timestamp'] - combined_df['Start Timestamp']).dt.total_seconds()
+
+    with stage(f'ingest/merge {folder}') as record:
+        # Load the trials.csv into a DataFrame
+        trials_df = pd.read_csv('trials.csv').rename(columns=lambda x: x.strip())  # strip spaces from this df too
+
+        # Merge the combined_df and trials_df on "Participant ID" and "Trial Number"
+        merge_columns = ['Participant ID', 'Trial Number']
+        combined_df = pd.merge(combined_df, trials_df[merge_columns + ['Sample Number', 'Sample Order', 'Sample Time', 'Comparison Time', 'Condition', 'Path', 'Foil']],
+                              on=merge_columns, how='left')
+
+        # Sort the combined_df by "Participant ID", "Trial Number", and "End Timestamp" in descending order
+        combined_df.sort_values(by=['Participant ID', 'Trial Number', 'End Timestamp'], ascending=[True, True, False], inplace=True)
+
+        # Drop duplicates based on "Participant ID" and "Trial Number", keeping the first occurrence (latest row)
+        combined_df.drop_duplicates(subset=['Participant ID', 'Trial Number'], keep='first', inplace=True)
+        record['Rows'] = len(combined_df)
+
+    with stage(f'ingest/reaction time components {folder}', rows=len(combined_df)):
+        # Split Reaction Time into movement onset, exploration and decision time using the probe data of these participants
+        combined_df = add_reaction_time_components(combined_df, folder, set(combined_df['Participant ID']))
+
+    # The participant ID within the group; (Rendering, Source ID) identifies a participant across all groups
+    combined_df['Source ID'] = combined_df['Participant ID']
+    return combined_df
+
+
+# Combine one group in a worker process; the stages it recorded are sent back for the timeline of this script
+def combine_group(group):
+    first_record = len(instrumentation.timeline)
+    return combine_folder(group, list_result_files(group)), instrumentation.timeline[first_record:]
+
+
+# Participant IDs are numbered in fixed blocks, one per group: VR 1-23, Desktop 24-46 and so on, in the order of
+# folders and then of any other group. The offsets do not depend on the files present, so adding or removing a
+# participant never renumbers anybody; larger studies (e.g. synthetic_study.py) set ANALYSIS_ID_BLOCK
+participants_per_group = int(os.environ.get('ANALYSIS_ID_BLOCK', 23))
+
+
+def group_offsets(groups=groups):
+    ordered = list(folders) + [group for group in groups if group not in folders]
+    return {group: ordered.index(group) * participants_per_group for group in groups}
+
+
+def assign_participant_ids(combined_df, groups=groups):
+    # A source ID outside its block would take the ID of a participant of the next group
+    outside = combined_df[(combined_df['Source ID'] < 1) | (combined_df['Source ID'] > participants_per_group)]
+    if not outside.empty:
+        found = sorted(set(zip(outside['Rendering'], outside['Source ID'])))
+        raise ValueError(f"Participant IDs outside 1-{participants_per_group}: {found}; raise ANALYSIS_ID_BLOCK")
+    combined_df['Participant ID'] = combined_df['Source ID'] + combined_df['Rendering'].map(group_offsets(groups))
+    return combined_df
+
+
+# Write the combined results in one go, next to the destination first so that no reader sees a partial file
+def write_combined(combined_df, path='combined_results.csv'):
+    with stage('ingest/write', rows=len(combined_df)):
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile(dir=directory, suffix='.csv', delete=False) as tmp:
+            tmp_path = tmp.name
+        try:
+            combined_df.to_csv(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+# Combine every group in its own worker and merge the shards in group order
+def combine(groups=groups, path='combined_results.csv', max_workers=None):
+    with ProcessPoolExecutor(max_workers=max_workers or min(len(groups), os.cpu_count())) as executor:
+        shards = list(executor.map(combine_group, groups))
+
+    for _, records in shards:
+        instrumentation.timeline.extend(records)
+    with stage('ingest/merge shards') as record:
+        combined_df = assign_participant_ids(pd.concat([shard for shard, _ in shards], ignore_index=True), groups)
+        record['Rows'] = len(combined_df)
+    write_combined(combined_df, path)
+    return combined_df
+
+
+if __name__ == '__main__':
+    combine(sys.argv[1:] or groups)
@@ -0,0 +1,175 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+from datetime import datetime
+
+import pandas as pd
+
+import pipeline
+import synthetic_study
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Total participants of the generated studies; other scales (up to 10000) can be passed on the command line
+scales = [10, 100, 1000]
+
+# Generated studies are kept here and reused while their manifest matches
+studies_dir = os.path.join(repo_dir, 'benchmarks')
+
+# Every benchmark run is appended here, tagged with the commit it ran on
+results_path = os.path.join(repo_dir, pipeline.reports_dir, 'benchmark_results.csv')
+results_columns = ['Run', 'Commit', 'Participants', 'Result Rows', 'Probe Rows', 'Script', 'Stage', 'Parent', 'Category', 'Status',
+                   'Wall Time', 'CPU Time', 'Peak RSS MB', 'Rows']
+
+# A stage this much slower than on the previous commit is reported as a regression; faster stages are too noisy to compare
+regression_ratio = 1.25
+min_wall_time = 0.05
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo_dir, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+
+# Generate the study of this scale unless the one on disk was generated with the same settings
+def prepare_study(participants, seed=synthetic_study.seed, regenerate=False):
+    directory = os.path.join(studies_dir, f'study_{participants}')
+    manifest_path = os.path.join(directory, 'study.json')
+    if not regenerate and os.path.exists(manifest_path):
+        manifest = json.load(open(manifest_path))
+        if manifest['participants'] == participants and manifest['seed'] == seed and 'participants_per_group' in manifest:
+            return directory, manifest
+
+    shutil.rmtree(directory, ignore_errors=True)
+    manifest = synthetic_study.generate_study(participants, directory, seed=seed)
+
+    # The questionnaires do not grow with the number of trials, the recorded ones are reused as they are
+    shutil.copytree(os.path.join(repo_dir, 'NASA TLX'), os.path.join(directory, 'NASA TLX'))
+    return directory, manifest
+
+
+# The Python stages of the pipeline, pointed at the scripts of this repository; figures are always rendered
+def benchmark_stages():
+    stages = []
+    for stage in pipeline.stages:
+        if stage['command'][0] != pipeline.python:
+            continue
+        command = [pipeline.python, os.path.join(repo_dir, stage['command'][1])] + stage['command'][2:]
+        if stage['name'] == 'figures':
+            command.append('--no-cache')
+        stages.append(dict(stage, command=command))
+    return stages
+
+
+def script_name(stage):
+    return os.path.splitext(os.path.basename(stage['command'][1]))[0]
+
+
+# Run every stage on the study in directory, one after the other so that they do not compete for the CPU
+# Returns the total of every script and the instrumented stages it recorded
+def run_study(directory, participants_per_group):
+    cwd = os.getcwd()
+    os.chdir(directory)
+    # Participant IDs of the generated groups are numbered in blocks as large as the largest group
+    id_block = os.environ.get('ANALYSIS_ID_BLOCK')
+    os.environ['ANALYSIS_ID_BLOCK'] = str(participants_per_group)
+    try:
+        shutil.rmtree(pipeline.reports_dir, ignore_errors=True)
+        shutil.rmtree('.figure_cache', ignore_errors=True)
+
+        totals = []
+        for stage in benchmark_stages():
+            returncode, wall, cpu = pipeline.run_stage(stage)
+            status = 'ok' if returncode == 0 else 'failed'
+            totals.append({'Script': script_name(stage), 'Stage': 'total', 'Category': 'script', 'Status': status,
+                           'Wall Time': wall, 'CPU Time': cpu})
+            print(f"  {stage['name']}: {status} in {wall:.2f} s")
+
+        timeline_path = os.path.join(pipeline.reports_dir, 'timeline', 'timeline.csv')
+        timeline_df = pd.read_csv(timeline_path) if os.path.exists(timeline_path) else pd.DataFrame(columns=['Script', 'Stage'])
+    finally:
+        os.chdir(cwd)
+        if id_block is None:
+            del os.environ['ANALYSIS_ID_BLOCK']
+        else:
+            os.environ['ANALYSIS_ID_BLOCK'] = id_block
+
+    timeline_df['Category'] = timeline_df['Stage'].str.split('/').str[0]
+    timeline_df['Status'] = 'ok'
+    return pd.concat([pd.DataFrame(totals), timeline_df], ignore_index=True)
+
+
+def benchmark(scales=scales, regenerate=False):
+    run = datetime.now().isoformat(timespec='seconds')
+    commit = git_commit()
+
+    results = []
+    for participants in scales:
+        print(f"{participants} participants:")
+        directory, manifest = prepare_study(participants, regenerate=regenerate)
+        result_df = run_study(directory, manifest['participants_per_group'])
+        result_df['Participants'] = participants
+        result_df['Result Rows'] = manifest['result_rows']
+        result_df['Probe Rows'] = manifest['probe_rows']
+        results.append(result_df)
+
+    results_df = pd.concat(results, ignore_index=True)
+    results_df['Run'] = run
+    results_df['Commit'] = commit
+    results_df = results_df[results_columns]
+
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    results_df.to_csv(results_path, mode='a', header=not os.path.exists(results_path), index=False)
+    return results_df
+
+
+# Time spent per category at every scale; nested stages of the same category are counted once
+def category_summary(results_df):
+    stages_df = results_df[results_df['Category'] != 'script']
+    parent_category = stages_df['Parent'].fillna('').str.split('/').str[0]
+    outermost = stages_df[parent_category != stages_df['Category']]
+    return outermost.pivot_table(index='Category', columns='Participants', values='Wall Time', aggfunc='sum')
+
+
+# Compare the latest run with the last run of an earlier commit, stage by stage and scale by scale
+def compare(history_df):
+    keys = ['Participants', 'Script', 'Stage']
+    latest_run = history_df['Run'].max()
+    latest = history_df[history_df['Run'] == latest_run]
+    earlier = history_df[(history_df['Run'] < latest_run) & (history_df['Commit'] != latest['Commit'].iloc[0])]
+    if earlier.empty:
+        return None
+
+    previous = earlier[earlier['Run'] == earlier['Run'].max()]
+    merged = latest.groupby(keys)['Wall Time'].sum().to_frame('Wall Time').join(
+        previous.groupby(keys)['Wall Time'].sum().rename('Previous Wall Time'), how='inner')
+    merged['Ratio'] = merged['Wall Time'] / merged['Previous Wall Time']
+    merged['Regression'] = (merged['Ratio'] > regression_ratio) & (merged['Wall Time'] > min_wall_time)
+    return merged.reset_index().assign(Commit=latest['Commit'].iloc[0], **{'Previous Commit': previous['Commit'].iloc[0]})
+
+
+def main():
+    selected = [int(arg) for arg in sys.argv[1:] if arg.isdigit()] or scales
+    results_df = benchmark(selected, regenerate='--regenerate' in sys.argv)
+
+    print("\nWall time (s) per category and number of participants:")
+    print(category_summary(results_df).round(2).to_string())
+
+    comparison = compare(pd.read_csv(results_path))
+    if comparison is None:
+        print(f"\nNo run of an earlier commit in {results_path} to compare with")
+        return
+    regressions = comparison[comparison['Regression']]
+    print(f"\n{len(regressions)} stages slower than {regression_ratio}x on {comparison['Previous Commit'].iloc[0]}:")
+    if not regressions.empty:
+        print(regressions.sort_values('Ratio', ascending=False).round(3).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from exclusions import apply_exclusions
+from instrumentation import instrument
+
+# Rows read at a time in the out-of-core mode; ANALYSIS_CHUNKSIZE switches the loaders in figures.py to it
+chunksize = int(os.environ.get('ANALYSIS_CHUNKSIZE', 0)) or None
+default_chunksize = 100000
+
+# Partial aggregates kept per group and measure; all of them merge by addition
+statistics = ['count', 'sum', 'sumsq']
+
+
+# Counts, sums and sums of squares of the measures per group of one chunk
+def partial_aggregates(chunk, keys, measures):
+    values = chunk[measures].astype(float)
+    valid = values.notna()
+    parts = pd.concat({'count': valid.astype(np.int64), 'sum': values.where(valid, 0.0), 'sumsq': values.where(valid, 0.0) ** 2}, axis=1)
+    return parts.groupby([chunk[key] for key in keys], sort=False).sum()
+
+
+# Fold a partial into the running totals; the totals never hold more than one row per group
+def merge_partials(totals, partial):
+    if totals is None:
+        return partial
+    return pd.concat([totals, partial]).groupby(level=list(range(totals.index.nlevels)), sort=False).sum()
+
+
+# Mean, variance (ddof=1) and standard deviation of every measure from the merged totals
+def finalize(totals, measures):
+    totals = totals.sort_index()
+    result = pd.DataFrame(index=totals.index)
+    for measure in measures:
+        count = totals[('count', measure)]
+        mean = totals[('sum', measure)] / count.where(count > 0)
+        # Guard against tiny negative variances from cancellation in sumsq - n * mean^2
+        var = ((totals[('sumsq', measure)] - count * mean ** 2) / (count - 1).where(count > 1)).clip(lower=0)
+        result[f'{measure} Count'] = count
+        result[f'{measure} Mean'] = mean
+        result[f'{measure} Var'] = var
+        result[f'{measure} Std'] = np.sqrt(var)
+    return result
+
+
+# Stream a CSV in chunks and aggregate the measures per group; prepare turns every raw chunk into the
+# columns that are grouped and aggregated, so memory grows with the number of groups, not of trials
+@instrument('aggregate/chunked')
+def aggregate_csv(path, keys, measures, prepare=None, chunksize=default_chunksize, usecols=None):
+    totals = None
+    for chunk in pd.read_csv(path, chunksize=chunksize, usecols=usecols):
+        if prepare is not None:
+            chunk = prepare(chunk)
+        totals = merge_partials(totals, partial_aggregates(chunk, keys, measures))
+    return finalize(totals, measures)
+
+
+# Columns the exclusion registry matches rows on
+exclusion_columns = ['Source ID', 'Trial Number', 'Start Timestamp']
+
+
+def interaction_chunk(chunk):
+    chunk = apply_exclusions(chunk, 'trials').drop(columns=exclusion_columns)
+    chunk.columns = chunk.columns.str.replace(' ', '_')
+    chunk['Error'] = 1 - chunk['Correctness'].astype(bool).astype(int)
+    return chunk
+
+
+# The table of figures.load_interaction_data, aggregated out of core
+def interaction_table(path='combined_results.csv', chunksize=default_chunksize):
+    keys = ['Participant_ID', 'Rendering', 'Condition']
+    stats = aggregate_csv(path, keys, ['Error', 'Reaction_Time'], prepare=interaction_chunk, chunksize=chunksize,
+                          usecols=['Participant ID', 'Rendering', 'Condition', 'Correctness', 'Reaction Time'] + exclusion_columns)
+
+    # Same layout as the in-memory path: every combination of the categories, empty ones dropped
+    agg_data = stats[['Error Mean', 'Reaction_Time Mean']].rename(columns=lambda x: x.replace(' Mean', '')).reset_index()
+    for key in keys:
+        agg_data[key] = pd.Categorical(agg_data[key], categories=sorted(agg_data[key].unique()))
+    full = pd.MultiIndex.from_product([agg_data[key].cat.categories for key in keys], names=keys).to_frame(index=False)
+    for key in keys:
+        full[key] = pd.Categorical(full[key], categories=agg_data[key].cat.categories)
+    agg_data = full.merge(agg_data, on=keys, how='left')
+    return agg_data.dropna(subset=['Error', 'Reaction_Time'])
+
+
+def joint_chunk(chunk):
+    chunk = apply_exclusions(chunk, 'trials').drop(columns=exclusion_columns)
+    chunk = chunk[chunk['Condition'].isin(['V', 'VH', 'H'])].copy()
+    chunk['Correctness'] = chunk['Correctness'].map({False: 1, True: 0})
+    return chunk
+
+
+# The per-participant table of figures.load_joint_data, aggregated out of core
+def joint_table(path='combined_results.csv', chunksize=default_chunksize):
+    keys = ['Participant ID', 'Condition', 'Rendering']
+    stats = aggregate_csv(path, keys, ['Correctness', 'Reaction Time'], prepare=joint_chunk, chunksize=chunksize,
+                          usecols=['Participant ID', 'Rendering', 'Condition', 'Correctness', 'Reaction Time'] + exclusion_columns)
+
+    df_grouped = stats[['Correctness Mean', 'Reaction Time Mean']].reset_index()
+    df_grouped.columns = keys + ['Correctness', 'Reaction_Time']
+    df_grouped['Rendering_Condition'] = df_grouped['Rendering'] + ' ' + df_grouped['Condition']
+    return df_grouped
+
+
+# Compare the out-of-core tables with the in-memory ones
+def main(path='combined_results.csv', chunksize=1000):
+    from figures import load_interaction_data, load_joint_data
+
+    chunksize = int(chunksize)
+    for name, chunked, in_memory in [
+        ('interaction', lambda: interaction_table(path, chunksize), lambda: load_interaction_data(path, chunksize=None)),
+        ('joint', lambda: joint_table(path, chunksize), lambda: load_joint_data(path)[1]),
+    ]:
+        start = time.perf_counter()
+        chunked_df = chunked()
+        chunked_time = time.perf_counter() - start
+        start = time.perf_counter()
+        in_memory_df = in_memory()
+        in_memory_time = time.perf_counter() - start
+
+        numeric = in_memory_df.select_dtypes('number').columns
+        difference = np.abs(chunked_df[numeric].to_numpy(dtype=float) - in_memory_df[numeric].to_numpy(dtype=float)).max()
+        same_keys = (chunked_df.drop(columns=numeric).astype(str).to_numpy() == in_memory_df.drop(columns=numeric).astype(str).to_numpy()).all()
+        print(f"{name}: {len(chunked_df)} groups, same keys: {same_keys}, largest difference {difference:.2e}, "
+              f"{chunked_time:.2f} s in chunks of {chunksize} rows, {in_memory_time:.2f} s in memory")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -3,14 +3,11 @@ from scipy.stats import kruskal, f_oneway, levene, shapiro
 from statsmodels.formula.api import ols
 import statsmodels.api as sm
 
-# Load the combined dataset
-combined_data = pd.read_csv('data.csv')
+from figures import load_learning_data
+from instrumentation import stage
 
-# Convert Correctness to numeric for analysis
-combined_data['Correctness'] = combined_data['Correctness'].astype(int)
-
-# Calculate the block number separately for each immersion type
-combined_data['Block'] = combined_data.groupby('Immersion')['TrialNumber'].transform(lambda x: (x - 1) // 15 + 1)
+# Load the combined dataset with numeric Correctness, Error Rate and the block number per immersion type
+combined_data = load_learning_data('data.csv')
 
 # Function to perform analysis for a given immersion type
 def analyze_immersion(data, immersion_type):
@@ -73,50 +70,8 @@ def analyze_immersion(data, immersion_type):
     print("p-value:", kruskal_p_rt)
 
 # Perform separate analysis
-analyze_immersion(combined_data, 'VR')
-analyze_immersion(combined_data, 'Desktop')
-
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from matplotlib.backends.backend_pdf import PdfPages
-
-# Convert Correctness to numeric for analysis
-combined_data['Correctness'] = combined_data['Correctness'].astype(int)
-
-# Calculate Error Rate as 1 - Correctness
-combined_data['ErrorRate'] = 1 - combined_data['Correctness']
-
-# Calculate the block number separately for each immersion type
-combined_data['Block'] = combined_data.groupby('Immersion')['TrialNumber'].transform(lambda x: (x - 1) // 15 + 1)
-
-# Create a PdfPages object to save the plots
-with PdfPages('learning_effects_plots.pdf') as pdf:
-    
-    # Create a figure for side-by-side plots
-    fig, axes = plt.subplots(1, 2, figsize=(14, 6))
-    
-    # Plot for Error Rates
-    sns.lineplot(data=combined_data, x='Block', y='ErrorRate', hue='Immersion', marker='o', ax=axes[0])
-    axes[0].set_title('Error Rates Across Experimental Runs')
-    axes[0].set_xlabel('Experimental Run')
-    axes[0].set_ylabel('Error Rate')
-    axes[0].legend(title='Immersion')
-
-    # Plot for Response Time
-    sns.lineplot(data=combined_data, x='Block', y='ReactionTime', hue='Immersion', marker='o', ax=axes[1])
-    axes[1].set_title('Response Times Across Experimental Runs')
-    axes[1].set_xlabel('Experimental Run')
-    axes[1].set_ylabel('Response Time (s)')
-    axes[1].legend(title='Immersion')
-    
-    # Adjust layout
-    plt.tight_layout()
-    
-    # Save the figure with side-by-side plots
-    pdf.savefig(fig)  # Save the current figure
-    plt.close()
-
-# Notify the user
-print("The plots have been saved to 'learning_effects_plots.pdf'.")
+for immersion in ['VR', 'Desktop']:
+    with stage(f'test/learning effects {immersion}', rows=len(combined_data)):
+        analyze_immersion(combined_data, immersion)
 
+# The plots of the learning effects (learning_effects_plots.pdf) are rendered by figure_pipeline.py, through its cache
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import t as t_dist
+
+from instrumentation import instrument
+
+# Same defaults as seaborn's point and line plots: 95 % percentile bootstrap of the mean with 1000 resamples
+n_boot = 1000
+ci_level = 95
+seed = 0
+
+# Resamples drawn at a time, so memory grows with the batch and not with n_boot x rows
+boot_batch = 100
+
+estimate_columns = ['Measure', 'N', 'Mean', 'CI Low', 'CI High']
+
+
+# Mean and confidence interval of every measure in every cell
+# All cells and measures are bootstrapped together: rows are sorted by cell, every (batch, rows) matrix of
+# resampling indices draws every row from its own cell and the resampled cell sums are one reduceat call per batch
+@instrument('aggregate/confidence intervals')
+def cell_estimates(df, measures, cells, method='bootstrap', n_boot=n_boot, ci=ci_level, seed=seed, batch=boot_batch):
+    df = df.dropna(subset=measures).sort_values(cells, kind='stable')
+    grouped = df.groupby(cells, observed=True, sort=False)
+    sizes = grouped.size().to_numpy()
+    starts = np.r_[0, np.cumsum(sizes)[:-1]]
+    codes = np.repeat(np.arange(len(sizes)), sizes)
+
+    values = df[measures].to_numpy(dtype=float)
+    means = np.add.reduceat(values, starts, axis=0) / sizes[:, None]
+    alpha = (100 - ci) / 2
+
+    if method == 'bootstrap':
+        rng = np.random.default_rng(seed)
+        boot_means = []
+        for first in range(0, n_boot, batch):
+            draws = starts[codes] + (rng.random((min(batch, n_boot - first), len(codes))) * sizes[codes]).astype(np.int64)
+            boot_means.append(np.add.reduceat(values[draws], starts, axis=1) / sizes[None, :, None])
+        boot_means = np.concatenate(boot_means)
+        low, high = np.percentile(boot_means, [alpha, 100 - alpha], axis=0)
+    elif method == 't':
+        squares = np.add.reduceat((values - means[codes]) ** 2, starts, axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sem = np.sqrt(squares / (sizes[:, None] - 1)) / np.sqrt(sizes[:, None])
+            half = t_dist.ppf(1 - alpha / 100, sizes[:, None] - 1) * sem
+        low, high = means - half, means + half
+    else:
+        raise ValueError(f"Unknown confidence interval method: {method}")
+
+    keys = grouped.size().index.to_frame(index=False)
+    tables = []
+    for position, measure in enumerate(measures):
+        table = keys.copy()
+        table['Measure'] = measure
+        table['N'] = sizes
+        table['Mean'] = means[:, position]
+        table['CI Low'] = low[:, position]
+        table['CI High'] = high[:, position]
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True)
+
+
+# Estimates behind interaction_plots.pdf: participant means per Rendering x Condition
+def interaction_estimates(agg_data, method='bootstrap'):
+    return cell_estimates(agg_data, ['Error', 'Reaction_Time'], ['Rendering', 'Condition'], method=method)
+
+
+# Estimates behind learning_effects_plots.pdf: trials per Immersion x Block
+def learning_effects_estimates(combined_data, method='bootstrap'):
+    return cell_estimates(combined_data, ['ErrorRate', 'ReactionTime'], ['Immersion', 'Block'], method=method)
+
+
+def main():
+    from figures import load_interaction_data, load_learning_data
+
+    interaction_df = interaction_estimates(load_interaction_data())
+    learning_df = learning_effects_estimates(load_learning_data())
+
+    print("Rendering x Condition:")
+    print(interaction_df)
+    print("\nImmersion x Block:")
+    print(learning_df)
+
+    interaction_df.to_csv('interaction_estimates.csv', index=False)
+    learning_df.to_csv('learning_effects_estimates.csv', index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.special import log_ndtr
+
+from exclusions import apply_exclusions
+from instrumentation import instrument
+
+# Ex-Gaussian parameters (mu, sigma, tau) of the reaction times of every participant x rendering x condition
+parameters_path = 'ex_gaussian.csv'
+
+cell_columns = ['Participant ID', 'Rendering', 'Condition']
+parameter_columns = ['Mu', 'Sigma', 'Tau']
+
+# Cells with fewer trials are left without parameters
+min_trials = 10
+
+# Bootstrap replicates of every cell for the confidence intervals; 0 skips the bootstrap
+n_bootstrap = int(os.environ.get('ANALYSIS_BOOTSTRAP', 200))
+bootstrap_seed = 0
+
+log_sqrt_2pi = 0.5 * np.log(2 * np.pi)
+
+
+# Reaction times of every cell as a (cells, trials) array padded with NaN, and the mask of the real values
+def padded_cells(values):
+    width = max(len(cell) for cell in values)
+    x = np.full((len(values), width), np.nan)
+    for row, cell in enumerate(values):
+        x[row, :len(cell)] = cell
+    return x, ~np.isnan(x)
+
+
+# Starting values of every cell: the method-of-moments estimate (tau from the skewness, mu and sigma from what
+# remains of the mean and variance), a mostly exponential and a mostly Gaussian split of the variance,
+# since the likelihood can have a local optimum on either side
+def starting_values(x, mask):
+    n = mask.sum(axis=1)
+    mean = np.nanmean(x, axis=1)
+    sd = np.nanstd(x, axis=1)
+    skew = np.nansum((x - mean[:, None]) ** 3, axis=1) / n / sd ** 3
+    tau = np.where(skew > 0, sd * np.clip(skew / 2, 0.01, 0.8) ** (1 / 3), 0.3 * sd)
+    sigma = np.sqrt(np.maximum(sd ** 2 - tau ** 2, (0.2 * sd) ** 2))
+    starts = [np.column_stack([mean - tau, sigma, tau])]
+    for share in [0.9, 0.1]:
+        tau = np.sqrt(share) * sd
+        starts.append(np.column_stack([mean - tau, np.sqrt(1 - share) * sd, tau]))
+    # A shifted exponential starting at the fastest trial, where the likelihood often peaks with sigma near 0
+    low = np.nanmin(x, axis=1)
+    starts.append(np.column_stack([low, 0.01 * sd, mean - low]))
+    return starts
+
+
+# Negative log-likelihood of every cell and its analytic gradient, with theta = (mu, log sigma, log tau) per cell
+# log f(x) = -log tau + (mu - x) / tau + sigma^2 / (2 tau^2) + log Phi(z), z = (x - mu) / sigma - sigma / tau
+def negative_log_likelihood(theta, x, mask):
+    mu, sigma, tau = theta[:, :1], np.exp(theta[:, 1:2]), np.exp(theta[:, 2:])
+    x = np.where(mask, x, mu)
+    z = (x - mu) / sigma - sigma / tau
+
+    log_cdf = log_ndtr(z)
+    log_f = -np.log(tau) + (mu - x) / tau + sigma ** 2 / (2 * tau ** 2) + log_cdf
+    # phi(z) / Phi(z), evaluated in logs so that it stays finite far in the lower tail
+    mills = np.exp(-0.5 * z ** 2 - log_sqrt_2pi - log_cdf)
+
+    d_mu = 1 / tau - mills / sigma
+    d_sigma = sigma / tau ** 2 - mills * ((x - mu) / sigma ** 2 + 1 / tau)
+    d_tau = -1 / tau + (x - mu) / tau ** 2 - sigma ** 2 / tau ** 3 + mills * sigma / tau ** 2
+
+    gradient = np.column_stack([
+        np.where(mask, d_mu, 0).sum(axis=1),
+        sigma[:, 0] * np.where(mask, d_sigma, 0).sum(axis=1),
+        tau[:, 0] * np.where(mask, d_tau, 0).sum(axis=1),
+    ])
+    return -np.where(mask, log_f, 0).sum(axis=1), -gradient
+
+
+# Maximum likelihood fit of a block of cells by damped Newton steps taken for all cells at once
+# The Hessian comes from differences of the analytic gradient; a cell keeps a step only when its likelihood improves,
+# and its damping grows or shrinks on its own, so every cell converges at its own pace
+def fit_block(job, max_iterations=200, tolerance=1e-6, step=1e-5):
+    x, mask, start = job
+    theta = np.column_stack([start[:, 0], np.log(start[:, 1]), np.log(start[:, 2])])
+    # sigma and tau are kept between a thousandth and a hundred times the cell's standard deviation, so a cell
+    # whose best fit is a pure Gaussian or a pure exponential stops at the bound instead of overflowing
+    log_sd = np.log(np.nanstd(x, axis=1))[:, None]
+    floor, ceiling = log_sd + np.log(1e-3), log_sd + np.log(100)
+    theta[:, 1:] = np.clip(theta[:, 1:], floor, ceiling)
+
+    damping = np.full(len(x), 1e-3)
+    value, gradient = negative_log_likelihood(theta, x, mask)
+    active = np.ones(len(x), dtype=bool)
+    for _ in range(max_iterations):
+        active &= np.abs(gradient).max(axis=1) > tolerance
+        if not active.any():
+            break
+        t, xa, ma = theta[active], x[active], mask[active]
+        with np.errstate(all='ignore'):
+            hessian = np.stack([(negative_log_likelihood(t + step * np.eye(3)[k], xa, ma)[1] - gradient[active]) / step
+                                for k in range(3)], axis=2)
+        hessian = np.nan_to_num((hessian + hessian.transpose(0, 2, 1)) / 2)
+        # Levenberg-Marquardt: scale the diagonal up until the step is a descent direction of a convex model
+        shifted = hessian + damping[active, None, None] * np.maximum(np.abs(hessian).max(axis=(1, 2)), 1)[:, None, None] * np.eye(3)
+        delta = np.linalg.solve(shifted, -gradient[active][..., None])[..., 0]
+        candidate = t + delta
+        candidate[:, 1:] = np.clip(candidate[:, 1:], floor[active], ceiling[active])
+
+        with np.errstate(all='ignore'):
+            new_value, new_gradient = negative_log_likelihood(candidate, xa, ma)
+        better = np.isfinite(new_value) & (new_value <= value[active])
+        index = np.flatnonzero(active)
+        theta[index[better]] = candidate[better]
+        value[index[better]] = new_value[better]
+        gradient[index[better]] = new_gradient[better]
+        damping[index] = np.where(better, damping[index] / 3, damping[index] * 4)
+
+        # Cells stuck at the floor of sigma or tau, or whose steps no longer change anything, are done
+        settled = (np.abs(delta).max(axis=1) < 1e-10) | (damping[index] > 1e8)
+        active[index[settled]] = False
+    return np.column_stack([theta[:, 0], np.exp(theta[:, 1]), np.exp(theta[:, 2])])
+
+
+# Fit padded cells in blocks spread over worker processes
+# Without a start, every cell is fitted from all starting values and keeps the most likely fit
+def fit_cells(x, mask, start=None, max_workers=None, block_size=4096):
+    starts = starting_values(x, mask) if start is None else [start]
+    x_all, mask_all, start_all = np.tile(x, (len(starts), 1)), np.tile(mask, (len(starts), 1)), np.vstack(starts)
+
+    blocks = [slice(i, i + block_size) for i in range(0, len(x_all), block_size)]
+    jobs = [(x_all[block], mask_all[block], start_all[block]) for block in blocks]
+    max_workers = max_workers or min(len(jobs), os.cpu_count())
+    if max_workers == 1:
+        fits = np.vstack([fit_block(job) for job in jobs])
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            fits = np.vstack(list(executor.map(fit_block, jobs)))
+
+    theta = np.column_stack([fits[:, 0], np.log(fits[:, 1]), np.log(fits[:, 2])])
+    values = negative_log_likelihood(theta, x_all, mask_all)[0].reshape(len(starts), len(x))
+    best = np.nanargmin(values, axis=0)
+    return fits.reshape(len(starts), len(x), 3)[best, np.arange(len(x))]
+
+
+# Resample the trials of every cell with replacement and refit all replicates together, starting from the fit
+def bootstrap(x, mask, estimates, n_bootstrap=n_bootstrap, seed=bootstrap_seed, max_workers=None):
+    rng = np.random.default_rng(seed)
+    n = mask.sum(axis=1)
+    # Draw positions uniformly below each cell's own trial count
+    positions = (rng.random((len(x), n_bootstrap, x.shape[1])) * n[:, None, None]).astype(int)
+    samples = np.take_along_axis(np.repeat(x[:, None, :], n_bootstrap, axis=1), positions, axis=2)
+    samples = np.where(mask[:, None, :], samples, np.nan).reshape(-1, x.shape[1])
+    start = np.repeat(estimates, n_bootstrap, axis=0)
+    return fit_cells(samples, ~np.isnan(samples), start, max_workers).reshape(len(x), n_bootstrap, 3)
+
+
+@instrument('model/ex-gaussian')
+def fit_ex_gaussian(trials_df, n_bootstrap=n_bootstrap, max_workers=None):
+    cells = trials_df.dropna(subset=['Reaction Time']).groupby(cell_columns, sort=True)['Reaction Time']
+    keys = cells.size().reset_index(name='Trials')
+    keys = keys[keys['Trials'] >= min_trials].reset_index(drop=True)
+    values = [cells.get_group(tuple(key)).to_numpy(dtype=float) for key in keys[cell_columns].itertuples(index=False)]
+
+    x, mask = padded_cells(values)
+    estimates = fit_cells(x, mask, max_workers=max_workers)
+    result = keys.assign(**{name: estimates[:, i] for i, name in enumerate(parameter_columns)})
+
+    if n_bootstrap:
+        replicates = bootstrap(x, mask, estimates, n_bootstrap, max_workers=max_workers)
+        low, high = np.percentile(replicates, [2.5, 97.5], axis=1)
+        for i, name in enumerate(parameter_columns):
+            result[f'{name} Low'] = low[:, i]
+            result[f'{name} High'] = high[:, i]
+    return result
+
+
+# Parameters for the ANOVA and mixed-model scripts, fitted (without the bootstrap) when they have not been written yet
+def load_parameters(path=parameters_path, combined_path='combined_results.csv'):
+    if os.path.exists(path):
+        return pd.read_csv(path)
+    return fit_ex_gaussian(apply_exclusions(pd.read_csv(combined_path), 'trials'), n_bootstrap=0)
+
+
+def main(path='combined_results.csv', output=parameters_path):
+    trials_df = apply_exclusions(pd.read_csv(path), 'trials')
+    result = fit_ex_gaussian(trials_df)
+    result.to_csv(output, index=False)
+
+    print(f"Fitted {len(result)} cells with {n_bootstrap} bootstrap replicates each")
+    print(result.groupby(['Rendering', 'Condition'])[parameter_columns].mean().round(3))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,144 @@
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+
+# Every exclusion of the study, one row each: a whole participant, one trial (Trial Number) or the trials that
+# started within a time window (Start and End), for all datasets or only 'trials', 'tlx' or 'probe'
+registry_path = 'exclusions.csv'
+registry_columns = ['Dataset', 'Rendering', 'Participant ID', 'Trial Number', 'Start', 'End', 'Reason']
+
+datasets = ['trials', 'tlx', 'probe']
+
+# 'cleaned' drops the excluded rows when the data is loaded, 'all' keeps them
+mode = os.environ.get('ANALYSIS_EXCLUSIONS', 'cleaned')
+modes = ['all', 'cleaned']
+
+
+# The registry is parsed once per change of the file
+@functools.lru_cache(maxsize=4)
+def _cached_registry(path, signature):
+    registry = pd.read_csv(path, dtype={'Dataset': str, 'Rendering': str, 'Reason': str}, parse_dates=['Start', 'End'])
+    unknown = set(registry['Dataset']) - set(datasets) - {'all'}
+    if unknown:
+        raise ValueError(f"Unknown datasets in {path}: {sorted(unknown)}")
+    return registry
+
+
+def registry_signature(path=registry_path):
+    stat = os.stat(path)
+    return os.path.abspath(path), (stat.st_mtime_ns, stat.st_size)
+
+
+# Participant IDs in the registry are the IDs within their group (the number of the participant file)
+def load_registry(path=registry_path):
+    return _cached_registry(*registry_signature(path)).copy()
+
+
+def entries_for(registry, dataset):
+    return registry[registry['Dataset'].isin(['all', dataset])]
+
+
+# Combined Participant IDs back to the ID within their group, for data that does not carry the Source ID column of
+# combined_results.csv; the blocks of groups passed on the command line of the ingest are unknown here
+def source_ids(df, rendering='Rendering', participant='Participant ID'):
+    from CombineVRandDesktopResults import group_offsets
+    offsets = df[rendering].map(group_offsets())
+    if offsets.isna().any():
+        raise ValueError(f"No participant ID block for renderings {sorted(df.loc[offsets.isna(), rendering].unique())}")
+    return df[participant] - offsets.astype(int)
+
+
+# Boolean mask of the rows matched by any entry of the registry for this dataset
+# The registry holds a handful of rows, so every entry is one vectorized comparison over the data
+def exclusion_mask(df, dataset, registry=None, rendering='Rendering', participant='Source ID', trial='Trial Number',
+                   timestamp='Start Timestamp', combined_ids=False):
+    registry = load_registry() if registry is None else registry
+    renderings = df[rendering].to_numpy()
+    participants = (source_ids(df, rendering, participant) if combined_ids else df[participant]).to_numpy()
+    trials = df[trial].to_numpy() if trial in df else None
+    times = pd.to_datetime(df[timestamp]).to_numpy() if timestamp in df else None
+
+    mask = np.zeros(len(df), dtype=bool)
+    entries = entries_for(registry, dataset).rename(columns=lambda x: x.replace(' ', '_'))
+    for entry in entries.itertuples(index=False):
+        match = (renderings == entry.Rendering) & (participants == entry.Participant_ID)
+        if pd.notna(entry.Trial_Number):
+            if trials is None:
+                continue
+            match &= trials == entry.Trial_Number
+        if pd.notna(entry.Start) or pd.notna(entry.End):
+            if times is None:
+                continue
+            if pd.notna(entry.Start):
+                match &= times >= entry.Start.to_datetime64()
+            if pd.notna(entry.End):
+                match &= times <= entry.End.to_datetime64()
+        mask |= match
+    return mask
+
+
+# Reason of the first registry entry matching every row, empty for rows that are kept
+def exclusion_reasons(df, dataset, registry=None, **columns):
+    registry = load_registry() if registry is None else registry
+    reasons = pd.Series('', index=df.index)
+    for position in range(len(registry)):
+        entry = registry.iloc[[position]]
+        if entry['Dataset'].iloc[0] in ('all', dataset):
+            match = exclusion_mask(df, dataset, entry, **columns) & (reasons == '').to_numpy()
+            reasons[match] = entry['Reason'].iloc[0]
+    return reasons
+
+
+# A dataset together with its precomputed exclusion mask; switching between the views only swaps the mask
+class ExclusionView:
+    def __init__(self, df, dataset, registry=None, mask=None, **columns):
+        self.df = df
+        self.mask = exclusion_mask(df, dataset, registry, **columns) if mask is None else mask
+        self._views = {'all': df}
+
+    def view(self, mode=mode):
+        if mode not in modes:
+            raise ValueError(f"Unknown exclusion mode '{mode}', use one of {modes}")
+        if mode not in self._views:
+            self._views[mode] = self.df[~self.mask]
+        return self._views[mode]
+
+
+# Drop the excluded rows of a dataset unless all rows are asked for
+def apply_exclusions(df, dataset, mode=mode, registry=None, **columns):
+    if mode == 'all' or (registry is None and not os.path.exists(registry_path)):
+        return df
+    return ExclusionView(df, dataset, registry, **columns).view(mode)
+
+
+# Mask of the probe index (one row per trial phase, as written by probe_resampling.py): participant and trial
+# entries match directly, time windows through the Start Timestamp of the trials in combined_results.csv
+def probe_mask(index_df, registry=None, combined_path='combined_results.csv'):
+    registry = load_registry() if registry is None else registry
+    entries = entries_for(registry, 'probe')
+    mask = exclusion_mask(index_df, 'probe', entries[entries['Start'].isna() & entries['End'].isna()], participant='Participant ID')
+
+    windows = entries[entries['Start'].notna() | entries['End'].notna()]
+    if len(windows) and os.path.exists(combined_path):
+        trials_df = pd.read_csv(combined_path, usecols=['Rendering', 'Source ID', 'Trial Number', 'Start Timestamp'])
+        excluded = trials_df[exclusion_mask(trials_df, 'probe', windows)][['Rendering', 'Source ID', 'Trial Number']]
+        keys = pd.MultiIndex.from_frame(excluded.rename(columns={'Source ID': 'Participant ID'}))
+        mask |= pd.MultiIndex.from_frame(index_df[['Rendering', 'Participant ID', 'Trial Number']]).isin(keys)
+    return mask
+
+
+def main():
+    registry = load_registry()
+    print(registry.to_string(index=False))
+
+    combined_df = pd.read_csv('combined_results.csv')
+    reasons = exclusion_reasons(combined_df, 'trials', registry)
+    print(f"\ncombined_results.csv: {(reasons != '').sum()} of {len(combined_df)} trials excluded")
+    if (reasons != '').any():
+        print(reasons[reasons != ''].value_counts().to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+import pandas as pd
+
+# Columns shared with the R scripts; the probe-derived columns are left out so that na.omit keeps every trial
+# Source ID (the number of the participant file) lets the exclusion registry match rows of data.csv
+export_columns = ['Participant ID', 'Trial Number', 'Response', 'Correctness', 'Start Timestamp', 'End Timestamp', 'Rendering',
+                  'Reaction Time', 'Sample Number', 'Sample Order', 'Sample Time', 'Comparison Time', 'Condition', 'Path', 'Foil',
+                  'Source ID']
+
+# Load the combined results
+combined_df = pd.read_csv('combined_results.csv')[export_columns]
+
+# Remove the spaces from the column names for R
+combined_df.columns = combined_df.columns.str.replace(' ', '')
+combined_df.to_csv('combined_results_r.csv', index=False)
+
+# data.csv uses the names from the paper: Immersion for Rendering and Modality for Condition
+combined_df.rename(columns={'Rendering': 'Immersion', 'Condition': 'Modality'}).to_csv('data.csv', index=False)
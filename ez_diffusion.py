@@ -0,0 +1,124 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from exclusions import apply_exclusions
+from instrumentation import instrument
+
+# EZ-diffusion estimates (Wagenmakers, van der Maas & Grasman, 2007) of every participant x rendering x condition
+parameters_path = 'ez_diffusion.csv'
+
+cell_columns = ['Participant ID', 'Rendering', 'Condition']
+parameter_columns = ['Drift Rate', 'Boundary Separation', 'Non Decision Time']
+
+# Scaling parameter of the diffusion process, by convention
+scale = 0.1
+
+# Bootstrap replicates for the confidence intervals (0 skips the bootstrap), drawn this many at a time
+n_bootstrap = int(os.environ.get('ANALYSIS_BOOTSTRAP', 1000))
+bootstrap_batch = 100
+bootstrap_seed = 0
+ci_level = 95
+
+
+# Drift rate, boundary separation and non-decision time from proportion correct and the mean and variance of
+# correct RTs, in closed form for arrays of any shape. Proportions of 0, 0.5 or 1 make the equations degenerate,
+# so they are moved by half a trial (the edge correction of Wagenmakers et al.); n is the number of trials
+def ez_parameters(proportion_correct, mean_rt, variance_rt, n):
+    half_trial = 1 / (2 * n)
+    pc = np.where(proportion_correct >= 1, 1 - half_trial, proportion_correct)
+    pc = np.where(pc <= 0, half_trial, pc)
+    pc = np.where(pc == 0.5, 0.5 + half_trial, pc)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        logit = np.log(pc / (1 - pc))
+        x = logit * (logit * pc ** 2 - logit * pc + pc - 0.5) / variance_rt
+        drift = np.sign(pc - 0.5) * scale * x ** 0.25
+        boundary = scale ** 2 * logit / drift
+        y = -drift * boundary / scale ** 2
+        mean_decision_time = (boundary / (2 * drift)) * (1 - np.exp(y)) / (1 + np.exp(y))
+        non_decision_time = mean_rt - mean_decision_time
+    return drift, boundary, non_decision_time
+
+
+# Trials, correct trials and the sum and sum of squares of correct RTs per cell: the aggregate cube EZ needs
+def cell_sums(trials_df):
+    df = trials_df.dropna(subset=['Reaction Time']).copy()
+    df['Correct'] = df['Correctness'].astype(bool).astype(int)
+    df['Correct RT'] = df['Reaction Time'] * df['Correct']
+    df['Correct RT Squared'] = df['Correct RT'] ** 2
+    return df.groupby(cell_columns, sort=True).agg(
+        Trials=('Correct', 'size'), Correct=('Correct', 'sum'),
+        **{'Correct RT': ('Correct RT', 'sum'), 'Correct RT Squared': ('Correct RT Squared', 'sum')})
+
+
+# EZ parameters from summed cells (the last axis of each array); cells with fewer than two correct trials have no
+# RT variance and so no estimate
+def ez_from_sums(trials, correct, rt_sum, rt_squares):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_rt = rt_sum / correct
+        variance_rt = np.where(correct > 1, (rt_squares - correct * mean_rt ** 2) / (correct - 1), np.nan)
+    return ez_parameters(correct / trials, mean_rt, variance_rt, trials)
+
+
+# Percentile intervals from resampling the trials of every cell: rows are sorted by cell and every replicate draws
+# each row from its own cell, so the replicate sums of all cells are one reduceat per batch of replicates
+def bootstrap(trials_df, n_bootstrap=n_bootstrap, batch=bootstrap_batch, seed=bootstrap_seed, ci=ci_level):
+    df = trials_df.dropna(subset=['Reaction Time']).sort_values(cell_columns, kind='stable')
+    sizes = df.groupby(cell_columns, sort=True).size().to_numpy()
+    starts = np.r_[0, np.cumsum(sizes)[:-1]]
+    codes = np.repeat(np.arange(len(sizes)), sizes)
+
+    correct = df['Correctness'].astype(bool).to_numpy(dtype=float)
+    rt = df['Reaction Time'].to_numpy(dtype=float) * correct
+    values = np.column_stack([correct, rt, rt ** 2])
+
+    rng = np.random.default_rng(seed)
+    replicates = []
+    for first in range(0, n_bootstrap, batch):
+        draws = starts[codes] + (rng.random((min(batch, n_bootstrap - first), len(codes))) * sizes[codes]).astype(np.int64)
+        sums = np.add.reduceat(values[draws], starts, axis=1)
+        replicates.append(np.stack(ez_from_sums(sizes, sums[..., 0], sums[..., 1], sums[..., 2]), axis=2))
+    replicates = np.concatenate(replicates)
+
+    alpha = (100 - ci) / 2
+    # Replicates without an estimate (e.g. fewer than two correct trials drawn) are left out of the interval
+    return np.nanpercentile(replicates, [alpha, 100 - alpha], axis=0)
+
+
+@instrument('model/ez-diffusion')
+def fit_ez_diffusion(trials_df, n_bootstrap=n_bootstrap):
+    sums = cell_sums(trials_df)
+    estimates = ez_from_sums(*(sums[column].to_numpy(dtype=float) for column in ['Trials', 'Correct', 'Correct RT', 'Correct RT Squared']))
+    result = sums[['Trials', 'Correct']].reset_index()
+    for name, values in zip(parameter_columns, estimates):
+        result[name] = values
+
+    if n_bootstrap:
+        low, high = bootstrap(trials_df, n_bootstrap)
+        for i, name in enumerate(parameter_columns):
+            result[f'{name} Low'] = low[:, i]
+            result[f'{name} High'] = high[:, i]
+    return result
+
+
+# Parameters for the ANOVA and mixed-model scripts, estimated (without the bootstrap) when they have not been written yet
+def load_parameters(path=parameters_path, combined_path='combined_results.csv'):
+    if os.path.exists(path):
+        return pd.read_csv(path)
+    return fit_ez_diffusion(apply_exclusions(pd.read_csv(combined_path), 'trials'), n_bootstrap=0)
+
+
+def main(path='combined_results.csv', output=parameters_path):
+    trials_df = apply_exclusions(pd.read_csv(path), 'trials')
+    result = fit_ez_diffusion(trials_df)
+    result.to_csv(output, index=False)
+
+    print(f"Estimated {len(result)} cells with {n_bootstrap} bootstrap replicates each")
+    print(result.groupby(['Rendering', 'Condition'])[parameter_columns].mean().round(3))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,89 @@
+import filecmp
+import hashlib
+import inspect
+import os
+import shutil
+import tempfile
+
+import matplotlib
+import numpy as np
+import pandas as pd
+import scipy
+import seaborn as sns
+
+# Rendered figures are stored here under the hash of everything that went into them
+cache_dir = '.figure_cache'
+
+# Library versions that change how a figure looks
+library_versions = {
+    'matplotlib': matplotlib.__version__,
+    'numpy': np.__version__,
+    'pandas': pd.__version__,
+    'scipy': scipy.__version__,
+    'seaborn': sns.__version__,
+}
+
+
+def update_hash(digest, value):
+    if isinstance(value, pd.DataFrame):
+        digest.update(repr(list(value.columns)).encode())
+        digest.update(repr(list(value.dtypes.astype(str))).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, pd.Series):
+        update_hash(digest, value.to_frame())
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            update_hash(digest, item)
+    else:
+        digest.update(repr(value).encode())
+
+
+# Style settings in effect when a figure is rendered; the backend only decides where it is drawn, not how it looks
+def style_settings():
+    return sorted((key, repr(value)) for key, value in matplotlib.rcParams.items() if not key.startswith('backend'))
+
+
+# Hash of the input tables, the source of the plotting function and of the whole module it is defined in (its
+# shared helpers, e.g. in figures.py), the matplotlib style and the library versions
+def cache_key(inputs, plot_function):
+    digest = hashlib.sha256()
+    update_hash(digest, inputs)
+    digest.update(inspect.getsource(plot_function).encode())
+    digest.update(inspect.getsource(inspect.getmodule(plot_function)).encode())
+    digest.update(repr(style_settings()).encode())
+    digest.update(repr(sorted(library_versions.items())).encode())
+    return digest.hexdigest()
+
+
+def cached_path(key, output):
+    return os.path.join(cache_dir, key + os.path.splitext(output)[1])
+
+
+# Copy a file through a temporary file in the destination folder, so the destination is never half written
+def atomic_copy(source, destination):
+    directory = os.path.dirname(os.path.abspath(destination))
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False) as tmp:
+        tmp_path = tmp.name
+    try:
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, destination)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# Put the cached rendering of the key in place of the output; returns False when it was never rendered
+def restore(output, key):
+    cached = cached_path(key, output)
+    if not os.path.exists(cached):
+        return False
+    if not (os.path.exists(output) and filecmp.cmp(output, cached, shallow=False)):
+        atomic_copy(cached, output)
+    return True
+
+
+# Keep a copy of a freshly rendered output under its key
+def store(output, key):
+    os.makedirs(cache_dir, exist_ok=True)
+    atomic_copy(output, cached_path(key, output))
+
@@ -0,0 +1,96 @@
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Render without a display so that no job blocks on plt.show()
+os.environ['MPLBACKEND'] = 'Agg'
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+import confidence_intervals
+import figure_cache
+import figures
+import instrumentation
+
+
+# Each job loads only its own inputs and builds one figure from them
+def interaction_inputs():
+    return (confidence_intervals.interaction_estimates(figures.load_interaction_data()),)
+
+
+def learning_effects_inputs():
+    return (confidence_intervals.learning_effects_estimates(figures.load_learning_data()),)
+
+
+def nasa_tlx_inputs():
+    return figures.tlx_summary(*figures.load_tlx_data())
+
+
+# Output file of every figure, the function that loads its inputs and the function that renders it
+figure_jobs = {
+    'joint_error_rate.pdf': (figures.load_joint_data, figures.joint_error_rate),
+    'joint_response_time.pdf': (figures.load_joint_data, figures.joint_response_time),
+    'interaction_plots.pdf': (interaction_inputs, figures.interaction_plots),
+    'learning_effects_plots.pdf': (learning_effects_inputs, figures.learning_effects_plots),
+    'nasa_tlx_scores.pdf': (nasa_tlx_inputs, figures.nasa_tlx_scores),
+}
+
+
+# Write the figure next to its destination first and move it into place, so a PDF is never half written
+def save_atomic(fig, path):
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.pdf', delete=False) as tmp:
+        tmp_path = tmp.name
+    try:
+        fig.savefig(tmp_path, format='pdf')
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# Render one figure unless a rendering of the same inputs and plot code is already cached
+# The stages recorded in the worker are sent back so they end up in the timeline of this script
+def render(output, use_cache=True):
+    first_record = len(instrumentation.timeline)
+    start = time.perf_counter()
+    with instrumentation.stage(f'render/{output}'):
+        load_inputs, plot_function = figure_jobs[output]
+        inputs = load_inputs()
+
+        key = figure_cache.cache_key(inputs, plot_function)
+        hit = use_cache and figure_cache.restore(output, key)
+        if not hit:
+            fig = plot_function(*inputs)
+            save_atomic(fig, output)
+            plt.close(fig)
+            figure_cache.store(output, key)
+    return output, hit, time.perf_counter() - start, instrumentation.timeline[first_record:]
+
+
+# Render the requested figures (all by default) in parallel, one process per figure
+def render_figures(outputs=None, max_workers=None, use_cache=True):
+    outputs = list(outputs or figure_jobs)
+    with ProcessPoolExecutor(max_workers=max_workers or min(len(outputs), os.cpu_count())) as executor:
+        results = list(executor.map(render, outputs, [use_cache] * len(outputs)))
+
+    for _, _, _, records in results:
+        instrumentation.timeline.extend(records)
+    return {output: (hit, seconds) for output, hit, seconds, _ in results}
+
+
+def main():
+    start = time.perf_counter()
+    results = render_figures(use_cache='--no-cache' not in sys.argv)
+    for output, (hit, seconds) in results.items():
+        print(f"{output}: {'cached' if hit else 'rendered'} in {seconds:.2f} s")
+
+    hits = sum(hit for hit, _ in results.values())
+    print(f"{hits} cache hits, {len(results) - hits} misses, {time.perf_counter() - start:.2f} s in total")
+
+
+if __name__ == '__main__':
+    main()
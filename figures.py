@@ -0,0 +1,308 @@
+import numpy as np
+import pandas as pd
+import seaborn as sns
+import matplotlib.pyplot as plt
+from scipy.stats import ttest_ind
+
+import chunked_aggregation
+import tlx
+from exclusions import apply_exclusions
+from instrumentation import instrument
+
+# Set font type for PDF export
+plt.rcParams['pdf.fonttype'] = 42
+plt.rcParams['ps.fonttype'] = 42
+
+tlx_dimensions = tlx.tlx_dimensions
+
+
+# ----------------- Data preparation -----------------
+
+# Trial-level error data and per participant means for joint_data_analysis.py
+@instrument('aggregate/joint')
+def load_joint_data(path='combined_results.csv'):
+    df = apply_exclusions(pd.read_csv(path), 'trials')
+
+    # Filter for only V, VH, and H conditions
+    df = df[df['Condition'].isin(['V', 'VH', 'H'])]
+
+    # Replace boolean correctness values with 0 and 1
+    mapping = {False: 1, True: 0}
+    df['Correctness'] = df['Correctness'].map(mapping)
+
+    # Group by Participant ID, Condition, and Rendering and calculate means
+    df_grouped = df.groupby(['Participant ID', 'Condition', 'Rendering']).agg({'Correctness': 'mean', 'Reaction Time': 'mean'}).reset_index()
+
+    # Rename the 'Reaction Time' column to 'Reaction_Time'
+    df_grouped = df_grouped.rename(columns={'Reaction Time': 'Reaction_Time'})
+
+    # Create a new column that combines 'Rendering' and 'Condition'
+    df_grouped['Rendering_Condition'] = df_grouped['Rendering'] + ' ' + df_grouped['Condition']
+    return df, df_grouped
+
+
+# Mean error rate and response time per participant, rendering and condition for interaction_analysis.py
+@instrument('aggregate/interaction')
+def load_interaction_data(path='combined_results.csv', chunksize=chunked_aggregation.chunksize):
+    # Aggregate out of core when a chunk size is set, e.g. for pooled studies that do not fit in memory
+    if chunksize:
+        return chunked_aggregation.interaction_table(path, chunksize)
+
+    df = apply_exclusions(pd.read_csv(path), 'trials')
+
+    # Rename columns to remove spaces and special characters
+    df.columns = df.columns.str.replace(' ', '_')
+
+    # Convert Correctness to error rates (1 for error, 0 for correct)
+    df['Error'] = df['Correctness'].apply(lambda x: 0 if x else 1)
+
+    # Convert relevant columns to categorical types
+    df['Participant_ID'] = df['Participant_ID'].astype('category')
+    df['Rendering'] = df['Rendering'].astype('category')
+    df['Condition'] = df['Condition'].astype('category')
+
+    # Aggregate data to get mean error rate and mean response time per participant per condition and rendering type
+    agg_data = df.groupby(['Participant_ID', 'Rendering', 'Condition'], observed=False).agg({'Error': 'mean', 'Reaction_Time': 'mean'}).reset_index()
+
+    # Remove rows with NaN values in the Error column
+    return agg_data.dropna(subset=['Error', 'Reaction_Time'])
+
+
+# Trial-level data with error rate and block number for combined_learning_effects.py
+@instrument('aggregate/learning effects')
+def load_learning_data(path='data.csv'):
+    # data.csv carries the column names of the paper; SourceID is the participant ID within the group
+    combined_data = apply_exclusions(pd.read_csv(path), 'trials', rendering='Immersion', participant='SourceID',
+                                     trial='TrialNumber', timestamp='StartTimestamp')
+
+    # Convert Correctness to numeric for analysis
+    combined_data['Correctness'] = combined_data['Correctness'].astype(int)
+
+    # Calculate Error Rate as 1 - Correctness
+    combined_data['ErrorRate'] = 1 - combined_data['Correctness']
+
+    # Calculate the block number separately for each immersion type
+    combined_data['Block'] = combined_data.groupby('Immersion')['TrialNumber'].transform(lambda x: (x - 1) // 15 + 1)
+    return combined_data
+
+
+# Filtered VR and Desktop NASA TLX answers for nasa_tlx.py
+@instrument('ingest/nasa tlx')
+def load_tlx_data(folder_path='NASA TLX'):
+    # All exports in one pass, with clean column names and the participants of exclusions.csv filtered out
+    surveys = tlx.load_surveys(folder_path)
+    vr_filtered = surveys[surveys['Rendering'] == 'VR'].drop(columns='Rendering')
+    desktop_filtered = surveys[surveys['Rendering'] == 'Desktop'].drop(columns='Rendering')
+    return vr_filtered, desktop_filtered
+
+
+# T-tests, means and standard deviations of every TLX dimension
+@instrument('test/nasa tlx t-tests')
+def tlx_summary(vr_filtered, desktop_filtered):
+    # One t-test per dimension, all dimensions in one call
+    t_test = ttest_ind(vr_filtered[tlx_dimensions].to_numpy(dtype=float), desktop_filtered[tlx_dimensions].to_numpy(dtype=float), nan_policy='omit')
+    filtered_t_test_results_df = pd.DataFrame({'t-statistic': np.asarray(t_test.statistic), 'p-value': np.asarray(t_test.pvalue)}, index=tlx_dimensions)
+
+    filtered_mean_values_df = pd.DataFrame({'VR': vr_filtered[tlx_dimensions].mean(), 'Desktop': desktop_filtered[tlx_dimensions].mean()})
+    filtered_std_values_df = pd.DataFrame({'VR': vr_filtered[tlx_dimensions].std(), 'Desktop': desktop_filtered[tlx_dimensions].std()})
+    return filtered_t_test_results_df, filtered_mean_values_df, filtered_std_values_df
+
+
+# ----------------- Figures -----------------
+
+# Define function to add significance bars
+def add_significance_bar(ax, x1, x2, y, text):
+    ax.plot([x1, x1, x2, x2], [y, y + 0.015, y + 0.015, y], lw=1.5, color='black')
+    ax.text((x1 + x2) * .5, y + 0.015, text, ha='center', va='bottom', color='black')
+
+
+# Error rates by display environment and sensory modality (joint_error_rate.pdf)
+@instrument('figure/joint_error_rate')
+def joint_error_rate(df, df_grouped):
+    # Sort the data so that the conditions are grouped together for each rendering
+    df_grouped = df_grouped.sort_values('Rendering_Condition')
+
+    fig, ax = plt.subplots(figsize=(12, 6))
+
+    sns.boxplot(x="Rendering_Condition", y="Correctness", data=df_grouped, palette="colorblind", ax=ax)
+
+    # Perform and annotate t-tests for each Rendering
+    conditions = ['V', 'H', 'VH']
+    for offset, rendering in [(0, 'Desktop'), (len(conditions), 'VR')]:
+        for i, cond1 in enumerate(conditions):
+            for j, cond2 in enumerate(conditions):
+                if i < j:
+                    group1 = df[(df['Rendering'] == rendering) & (df['Condition'] == cond1)]['Correctness']
+                    group2 = df[(df['Rendering'] == rendering) & (df['Condition'] == cond2)]['Correctness']
+                    t_stat, p_val = ttest_ind(group1, group2)
+                    if p_val < 0.05:
+                        max_val = df_grouped['Correctness'].max()
+                        add_significance_bar(ax, offset + i, offset + j, max_val + 0.06 * (j-i), '*')
+
+    ax.set_title('Error Rates by Display Environment and Sensory Modality')
+    ax.set_xlabel('Display Environment and Sensory Modality')
+    ax.set_ylabel('Error Rate')
+
+    # Modify the x-axis labels
+    labels = ['Haptic (Surface)', 'Visual (Surface)', 'Visuohaptic (Surface)', 'Haptic (VR)', 'Visual (VR)', 'Visuohaptic (VR)']
+    ax.set_xticklabels(labels)
+
+    fig.tight_layout()
+    return fig
+
+
+# Response times by display environment and sensory modality (joint_response_time.pdf)
+@instrument('figure/joint_response_time')
+def joint_response_time(df, df_grouped):
+    # Sort the data so that the conditions are grouped together for each rendering
+    df_grouped = df_grouped.sort_values('Rendering_Condition')
+
+    fig, ax = plt.subplots(figsize=(12, 6))
+
+    sns.boxplot(x="Rendering_Condition", y="Reaction_Time", data=df_grouped, palette="colorblind", ax=ax)
+
+    # Perform and annotate t-tests for each Rendering (Reaction Time)
+    conditions = ['V', 'H', 'VH']
+    for rendering, (x1, x2, x3) in [('Desktop', (0, 1, 2)), ('VR', (3, 4, 5))]:
+        for i, cond1 in enumerate(conditions):
+            for j, cond2 in enumerate(conditions):
+                if i < j:
+                    group1 = df[(df['Rendering'] == rendering) & (df['Condition'] == cond1)]['Reaction Time']
+                    group2 = df[(df['Rendering'] == rendering) & (df['Condition'] == cond2)]['Reaction Time']
+                    t_stat, p_val = ttest_ind(group1, group2)
+                    if p_val < 0.05:
+                        y, h, col = df_grouped['Reaction_Time'].max() + 2, 2, 'k'
+
+                        ax.plot([x1, x1, x2, x2], [y-1.25, y-1, y-1, y-1.25], lw=1.5, c=col)
+                        ax.text((x1+x2)*.5, y-1, "*", ha='center', va='bottom', color=col)
+
+                        ax.plot([x1, x1, x3, x3], [y, y+0.25, y+0.25, y], lw=1.5, c=col)
+                        ax.text((x1+x3)*.5, y+0.25, "*", ha='center', va='bottom', color=col)
+
+    ax.set_title('Response Time by Display Environment and Sensory Modality')
+    ax.set_xlabel('Display Environment and Sensory Modality')
+    ax.set_ylabel('Response Time in Seconds')
+
+    # Modify the x-axis labels
+    labels = ['Haptic (Surface)', 'Visual (Surface)', 'Visuohaptic (Surface)', 'Haptic (VR)', 'Visual (VR)', 'Visuohaptic (VR)']
+    ax.set_xticklabels(labels)
+
+    fig.tight_layout()
+    return fig
+
+
+# Point estimates with confidence interval bars, one dodged series per hue level
+def draw_points(ax, estimates, measure, x, hue, markers, palette, dodge=True, capsize=4):
+    table = estimates[estimates['Measure'] == measure]
+    categories = list(pd.unique(table[x]))
+    levels = list(pd.unique(table[hue]))
+    width = .025 * len(levels) if dodge else 0
+    offsets = np.linspace(-width / 2, width / 2, len(levels)) if len(levels) > 1 else [0]
+    colors = sns.color_palette(palette, len(levels))
+
+    for level, offset, marker, color in zip(levels, offsets, markers, colors):
+        rows = table[table[hue] == level].set_index(x).reindex(categories)
+        positions = np.arange(len(categories)) + offset
+        errors = [rows['Mean'] - rows['CI Low'], rows['CI High'] - rows['Mean']]
+        ax.errorbar(positions, rows['Mean'], yerr=errors, marker=marker, color=color, capsize=capsize, elinewidth=1, label=level)
+
+    ax.set_xticks(np.arange(len(categories)))
+    ax.set_xticklabels(categories)
+
+
+# Interaction between immersion and modality on error rates and response times (interaction_plots.pdf)
+# Drawn from the precomputed Rendering x Condition estimates of confidence_intervals.interaction_estimates
+@instrument('figure/interaction_plots')
+def interaction_plots(estimates):
+    # Create a new figure with two subplots side by side
+    fig, axs = plt.subplots(1, 2, figsize=(15, 6))
+
+    # Visualization of the interaction effects on Error Rates
+    draw_points(axs[0], estimates, 'Error', 'Condition', 'Rendering', markers=['o', 's'], palette='colorblind')
+    axs[0].set_title('Interaction between Immersion and Modality on Error Rates')
+    axs[0].set_xlabel('Modality', labelpad=15)
+    axs[0].set_ylabel('Error Rate')
+    axs[0].legend(title='Immersion')
+    axs[0].set_xticklabels(['Haptic', 'Visual', 'Visuohaptic'])
+
+    # Visualization of the interaction effects on Reaction Times
+    draw_points(axs[1], estimates, 'Reaction_Time', 'Condition', 'Rendering', markers=['o', 's'], palette='colorblind')
+    axs[1].set_title('Interaction between Immersion and Modality on Response Time')
+    axs[1].set_xlabel('Modality', labelpad=15)
+    axs[1].set_ylabel('Response Time')
+    axs[1].legend(title='Immersion')
+    axs[1].set_xticklabels(['Haptic', 'Visual', 'Visuohaptic'])
+
+    # Adjust the layout of the figure
+    fig.tight_layout()
+    return fig
+
+
+# Mean lines with shaded confidence bands, one per hue level
+def draw_lines(ax, estimates, measure, x, hue, marker='o'):
+    table = estimates[estimates['Measure'] == measure]
+    levels = list(pd.unique(table[hue]))
+    for level, color in zip(levels, sns.color_palette(n_colors=len(levels))):
+        rows = table[table[hue] == level].sort_values(x)
+        ax.plot(rows[x], rows['Mean'], marker=marker, color=color, label=level)
+        ax.fill_between(rows[x], rows['CI Low'], rows['CI High'], color=color, alpha=.2, linewidth=0)
+
+
+# Error rates and response times across experimental runs (learning_effects_plots.pdf)
+# Drawn from the precomputed Immersion x Block estimates of confidence_intervals.learning_effects_estimates
+@instrument('figure/learning_effects_plots')
+def learning_effects_plots(estimates):
+    # Create a figure for side-by-side plots
+    fig, axes = plt.subplots(1, 2, figsize=(14, 6))
+
+    # Plot for Error Rates
+    draw_lines(axes[0], estimates, 'ErrorRate', 'Block', 'Immersion')
+    axes[0].set_title('Error Rates Across Experimental Runs')
+    axes[0].set_xlabel('Experimental Run')
+    axes[0].set_ylabel('Error Rate')
+    axes[0].legend(title='Immersion')
+
+    # Plot for Response Time
+    draw_lines(axes[1], estimates, 'ReactionTime', 'Block', 'Immersion')
+    axes[1].set_title('Response Times Across Experimental Runs')
+    axes[1].set_xlabel('Experimental Run')
+    axes[1].set_ylabel('Response Time (s)')
+    axes[1].legend(title='Immersion')
+
+    # Adjust layout
+    fig.tight_layout()
+    return fig
+
+
+# Mean NASA TLX scores with standard deviations and significance annotations (nasa_tlx_scores.pdf)
+@instrument('figure/nasa_tlx_scores')
+def nasa_tlx_scores(filtered_t_test_results_df, filtered_mean_values_df, filtered_std_values_df):
+    # Create bar graphs with error bars for standard deviation and significance annotations
+    fig, ax = plt.subplots(figsize=(14, 10))
+    filtered_mean_values_df.plot(kind='bar', yerr=filtered_std_values_df, capsize=4, ax=ax, color=['skyblue', 'salmon'])
+
+    # Add significance annotations
+    significant_threshold = 0.05
+    for i, dimension in enumerate(tlx_dimensions):
+        p_value = filtered_t_test_results_df.loc[dimension, 'p-value']
+        if p_value < significant_threshold:
+            # Get the coordinates of the bars
+            bar_vr = ax.patches[i]
+            bar_desktop = ax.patches[i + len(tlx_dimensions)]
+
+            # Calculate the position for the annotation
+            x1 = bar_vr.get_x() + bar_vr.get_width() / 2
+            x2 = bar_desktop.get_x() + bar_desktop.get_width() / 2
+            y = max(bar_vr.get_height(), bar_desktop.get_height()) + 0.5
+
+            # Add the annotation
+            ax.text((x1 + x2) / 2, y + 0.25, '*', ha='center', va='bottom', color='black', fontsize=14)
+
+    ax.set_title('Mean NASA TLX Scores for VR and Desktop Conditions')
+    ax.set_xlabel('Dimensions')
+    ax.set_ylabel('Mean Scores')
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.legend(title='Study', loc='upper right')
+
+    fig.tight_layout()
+    return fig
@@ -0,0 +1,201 @@
+import atexit
+import cProfile
+import csv
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Folder the timeline of this process is written to; nothing is written when it is not set
+timeline_dir = os.environ.get('ANALYSIS_TIMELINE')
+
+# Capture a cProfile dump and the tracemalloc peak of every stage
+profile_stages = os.environ.get('ANALYSIS_PROFILE') == '1'
+trace_memory = os.environ.get('ANALYSIS_TRACEMALLOC') == '1'
+
+timeline_columns = ['Script', 'Stage', 'Parent', 'Start', 'Wall Time', 'CPU Time', 'Peak RSS MB', 'Peak Traced MB', 'Rows']
+
+timeline = []
+_open_stages = []
+_profiler_active = False
+
+
+# Peak resident memory of a stage: Linux keeps a high-water mark of the process (VmHWM) that can be reset, so it
+# is reset whenever a stage starts or ends and a stage reports its own peak. Elsewhere (e.g. macOS) only the peak of
+# the whole process is known (ru_maxrss), and a stage reports how much it raised that peak
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def process_peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# Whether the high-water mark can be reset, found out when the first stage starts rather than on import
+_rss_resettable = None
+
+
+def reset_peak_rss():
+    global _rss_resettable
+    if _rss_resettable is not False:
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+            _rss_resettable = True
+        except OSError:
+            _rss_resettable = False
+    return _rss_resettable
+
+
+# Fold the peaks reached since the last reset into a record; a stage keeps the highest of its own peaks and those of
+# its children, and resetting the counters for a child no longer loses what the parent reached before it
+def fold_peaks(record):
+    if _rss_resettable:
+        record['peak_rss'] = max(record['peak_rss'], peak_rss_mb() or 0)
+    if trace_memory and tracemalloc.is_tracing():
+        record['peak_traced'] = max(record['peak_traced'], tracemalloc.get_traced_memory()[1])
+
+
+def reset_peaks():
+    reset_peak_rss()
+    if trace_memory:
+        tracemalloc.reset_peak()
+
+
+# Record wall time, CPU time, peak memory and row count of a block of code
+# Set record['Rows'] inside the block to report how many rows the stage handled
+@contextmanager
+def stage(name, rows=None):
+    global _profiler_active
+    parent = _open_stages[-1] if _open_stages else None
+    record = {'Stage': name, 'Parent': parent['Stage'] if parent else '', 'Rows': rows, 'peak_rss': 0, 'peak_traced': 0}
+    if parent is not None:
+        fold_peaks(parent)
+    _open_stages.append(record)
+
+    profiler = None
+    if profile_stages and not _profiler_active:
+        profiler = cProfile.Profile()
+        _profiler_active = True
+        profiler.enable()
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    reset_peaks()
+    start_rss = process_peak_rss_mb()
+
+    record['Start'] = datetime.now().isoformat(timespec='milliseconds')
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        record['Wall Time'] = time.perf_counter() - start_wall
+        record['CPU Time'] = time.process_time() - start_cpu
+
+        fold_peaks(record)
+        if _rss_resettable:
+            record['Peak RSS MB'] = record['peak_rss']
+        else:
+            end_rss = process_peak_rss_mb()
+            record['Peak RSS MB'] = end_rss - start_rss if end_rss is not None else None
+        record['Peak Traced MB'] = record['peak_traced'] / (1024 * 1024) if trace_memory else None
+        if profiler is not None:
+            profiler.disable()
+            _profiler_active = False
+            if timeline_dir:
+                os.makedirs(os.path.join(timeline_dir, 'profiles'), exist_ok=True)
+                profiler.dump_stats(os.path.join(timeline_dir, 'profiles', f'{script_name()}.{name.replace("/", "_").replace(" ", "_")}.prof'))
+
+        _open_stages.pop()
+        if parent is not None:
+            parent['peak_rss'] = max(parent['peak_rss'], record['peak_rss'])
+            parent['peak_traced'] = max(parent['peak_traced'], record['peak_traced'])
+        reset_peaks()
+        record.pop('peak_rss')
+        record.pop('peak_traced')
+        timeline.append(record)
+
+
+def count_rows(result):
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return len(result)
+    if isinstance(result, tuple):
+        return next((len(item) for item in result if isinstance(item, (pd.DataFrame, pd.Series))), None)
+    return None
+
+
+# Decorator form of stage(); the row count is taken from a returned DataFrame when there is one
+def instrument(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name) as record:
+                result = function(*args, **kwargs)
+                if record['Rows'] is None:
+                    record['Rows'] = count_rows(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def script_name():
+    return os.path.splitext(os.path.basename(sys.argv[0] or 'interactive'))[0]
+
+
+# Write this process's stages to <dir>/<script>.json and append them to <dir>/timeline.csv
+# Worker processes only send their stages back to the script that started them, which writes them once
+def write_timeline(directory=None):
+    directory = directory or timeline_dir
+    if not directory or not timeline or multiprocessing.parent_process() is not None:
+        return
+    os.makedirs(directory, exist_ok=True)
+
+    rows = [{'Script': script_name(), **record} for record in timeline]
+    with open(os.path.join(directory, f'{script_name()}.json'), 'w') as f:
+        json.dump(rows, f, indent=1)
+
+    path = os.path.join(directory, 'timeline.csv')
+    new_file = not os.path.exists(path)
+    with open(path, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=timeline_columns)
+        if new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+atexit.register(write_timeline)
+
+
+# Summarise a timeline.csv: total time and peak memory of every stage, slowest first
+def main(path=os.path.join('reports', 'timeline', 'timeline.csv')):
+    timeline_df = pd.read_csv(path)
+    summary = timeline_df.groupby(['Script', 'Stage']).agg(
+        Runs=('Wall Time', 'size'), Wall=('Wall Time', 'sum'), CPU=('CPU Time', 'sum'),
+        Peak_RSS_MB=('Peak RSS MB', 'max'), Rows=('Rows', 'max'))
+    print(summary.sort_values('Wall', ascending=False).to_string())
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
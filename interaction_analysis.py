@@ -2,63 +2,84 @@
 
 import pandas as pd
 import statsmodels.formula.api as smf
-import seaborn as sns
 import matplotlib.pyplot as plt
 import pingouin as pg
 import warnings
-from matplotlib.backends.backend_pdf import PdfPages
 import statsmodels.api as sm
 
+import ez_diffusion
+from confidence_intervals import interaction_estimates
+from ex_gaussian import load_parameters, parameter_columns
+from figures import load_interaction_data
+from exclusions import apply_exclusions
+from instrumentation import stage
+from stimulus_features import attach_features
+
 # Too many warnings from plotting
 warnings.filterwarnings('ignore')
 
-# Load the data
-df = pd.read_csv('combined_results.csv')
-
-# Rename columns to remove spaces and special characters
-df.columns = df.columns.str.replace(' ', '_')
-
-# Data preprocessing
-# Convert Correctness to error rates (1 for error, 0 for correct)
-df['Error'] = df['Correctness'].apply(lambda x: 0 if x else 1)
-
-# Convert relevant columns to categorical types
-df['Participant_ID'] = df['Participant_ID'].astype('category')
-df['Rendering'] = df['Rendering'].astype('category')
-df['Condition'] = df['Condition'].astype('category')
-
-# Aggregate data to get mean error rate and mean response time per participant per condition and rendering type
-agg_data = df.groupby(['Participant_ID', 'Rendering', 'Condition'], observed=False).agg({'Error': 'mean', 'Reaction_Time': 'mean'}).reset_index()
-
-# Remove rows with NaN values in the Error column
-agg_data = agg_data.dropna(subset=['Error', 'Reaction_Time'])
+# Load the data and aggregate the mean error rate and mean response time per participant per condition and rendering type
+agg_data = load_interaction_data('combined_results.csv')
 
 # Check the cleaned aggregated data
 print("\nCleaned aggregated data:")
 print(agg_data.head())
 
 # Perform the Shapiro-Wilk test for the 'Error' column
-normality_test_error = pg.normality(agg_data['Error'], method='shapiro')
+with stage('test/shapiro error', rows=len(agg_data)):
+    normality_test_error = pg.normality(agg_data['Error'], method='shapiro')
 print(normality_test_error)
 
 # Perform the Shapiro-Wilk test for the 'Reaction_Time' column
-normality_test_reaction_time = pg.normality(agg_data['Reaction_Time'], method='shapiro')
+with stage('test/shapiro reaction time', rows=len(agg_data)):
+    normality_test_reaction_time = pg.normality(agg_data['Reaction_Time'], method='shapiro')
 print(normality_test_reaction_time)
 
 # Fit a Linear Mixed Model for Error Rates with specified optimizers
-error_model = smf.mixedlm("Error ~ Rendering * Condition", agg_data, groups=agg_data["Participant_ID"], re_formula="~Condition")
-error_fit = error_model.fit(method='nm', maxiter=1000, full_output=True)  # Nelder-Mead
-if not error_fit.converged:
-    error_fit = error_model.fit(method='bfgs', maxiter=1000, full_output=True)  # BFGS
+with stage('model/mixedlm error', rows=len(agg_data)):
+    error_model = smf.mixedlm("Error ~ Rendering * Condition", agg_data, groups=agg_data["Participant_ID"], re_formula="~Condition")
+    error_fit = error_model.fit(method='nm', maxiter=1000, full_output=True)  # Nelder-Mead
+    if not error_fit.converged:
+        error_fit = error_model.fit(method='bfgs', maxiter=1000, full_output=True)  # BFGS
 print(error_fit.summary())
 
 # Fit a Linear Mixed Model for Reaction Times with specified optimizers
-reaction_time_model = smf.mixedlm("Reaction_Time ~ Rendering * Condition", agg_data, groups=agg_data["Participant_ID"], re_formula="~Condition")
-reaction_time_fit = reaction_time_model.fit(method='nm', maxiter=1000, full_output=True)  # Nelder-Mead
-if not reaction_time_fit.converged:
-    reaction_time_fit = reaction_time_model.fit(method='bfgs', maxiter=1000, full_output=True)  # BFGS
+with stage('model/mixedlm reaction time', rows=len(agg_data)):
+    reaction_time_model = smf.mixedlm("Reaction_Time ~ Rendering * Condition", agg_data, groups=agg_data["Participant_ID"], re_formula="~Condition")
+    reaction_time_fit = reaction_time_model.fit(method='nm', maxiter=1000, full_output=True)  # Nelder-Mead
+    if not reaction_time_fit.converged:
+        reaction_time_fit = reaction_time_model.fit(method='bfgs', maxiter=1000, full_output=True)  # BFGS
 print(reaction_time_fit.summary())
 
+# Trial-level Linear Mixed Model for Reaction Times with the path complexity of each stimulus as covariates
+trial_data = attach_features(apply_exclusions(pd.read_csv('combined_results.csv'), 'trials'), rename=lambda x: x.replace(' ', '_'))
+trial_data.columns = trial_data.columns.str.replace(' ', '_')
+with stage('model/mixedlm reaction time with complexity', rows=len(trial_data)):
+    complexity_model = smf.mixedlm("Reaction_Time ~ Rendering * Condition + Turns + Path_Extent + Backtracks + Foil_Divergence_Index",
+                                   trial_data, groups=trial_data["Participant_ID"])
+    complexity_fit = complexity_model.fit(method='lbfgs', maxiter=1000)
+print(complexity_fit.summary())
+
+# Linear Mixed Models of the ex-Gaussian parameters of the Reaction Time distribution, one per parameter
+ex_gaussian = load_parameters()
+for parameter in parameter_columns:
+    with stage(f'model/mixedlm ex-gaussian {parameter.lower()}', rows=len(ex_gaussian)):
+        parameter_model = smf.mixedlm(f"{parameter} ~ Rendering * Condition", ex_gaussian, groups=ex_gaussian["Participant ID"])
+        parameter_fit = parameter_model.fit(method='nm', maxiter=1000, full_output=True)  # Nelder-Mead
+        if not parameter_fit.converged:
+            parameter_fit = parameter_model.fit(method='bfgs', maxiter=1000, full_output=True)  # BFGS
+    print(parameter_fit.summary())
+
+# Linear Mixed Models of the EZ-diffusion parameters, one per parameter
+ez = ez_diffusion.load_parameters()
+for parameter in ez_diffusion.parameter_columns:
+    with stage(f'model/mixedlm ez-diffusion {parameter.lower()}', rows=len(ez)):
+        parameter_model = smf.mixedlm(f'Q("{parameter}") ~ Rendering * Condition', ez, groups=ez["Participant ID"])
+        parameter_fit = parameter_model.fit(method='nm', maxiter=1000, full_output=True)  # Nelder-Mead
+        if not parameter_fit.converged:
+            parameter_fit = parameter_model.fit(method='bfgs', maxiter=1000, full_output=True)  # BFGS
+    print(parameter_fit.summary())
+
 # Diagnostics: Residual plots and random effects
 
 # Residual plot for error model
@@ -84,36 +105,12 @@ print(error_fit.random_effects)
 print("\nRandom effects for reaction time model:")
 print(reaction_time_fit.random_effects)
 
-# Create a new PDF file for plots
-pdf_pages = PdfPages('interaction_plots.pdf')
-
-# Create a new figure with two subplots side by side
-fig, axs = plt.subplots(1, 2, figsize=(15, 6))
-
-# Visualization of the interaction effects on Error Rates
-sns.pointplot(x='Condition', y='Error', hue='Rendering', data=agg_data, dodge=True, markers=['o', 's'], capsize=0.1, errwidth=1, palette='colorblind', ax=axs[0])
-axs[0].set_title('Interaction between Immersion and Modality on Error Rates')
-axs[0].set_xlabel('Modality', labelpad=15)
-axs[0].set_ylabel('Error Rate')
-axs[0].legend(title='Immersion')
-axs[0].set_xticklabels(['Haptic', 'Visual', 'Visuohaptic'])
-
-# Visualization of the interaction effects on Reaction Times
-sns.pointplot(x='Condition', y='Reaction_Time', hue='Rendering', data=agg_data, dodge=True, markers=['o', 's'], capsize=0.1, errwidth=1, palette='colorblind', ax=axs[1])
-axs[1].set_title('Interaction between Immersion and Modality on Response Time')
-axs[1].set_xlabel('Modality', labelpad=15)
-axs[1].set_ylabel('Response Time')
-axs[1].legend(title='Immersion')
-axs[1].set_xticklabels(['Haptic', 'Visual', 'Visuohaptic'])
-
-# Adjust the layout of the figure
-plt.tight_layout()
-
-# Save the current figure to the PDF file
-pdf_pages.savefig(fig)
+# Means and bootstrap confidence intervals per Rendering x Condition, computed once for the plots
+estimates = interaction_estimates(agg_data)
+print("\nMeans and 95% confidence intervals per Rendering x Condition:")
+print(estimates)
 
-# Close the PDF file
-pdf_pages.close()
+# The plots of these estimates (interaction_plots.pdf) are rendered by figure_pipeline.py, through its cache
 
 # Calculate mean error rate and mean response time per condition per rendering
 mean_data = agg_data.groupby(['Rendering', 'Condition']).agg({'Error': 'mean', 'Reaction_Time': 'mean'}).reset_index()
@@ -0,0 +1,162 @@
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy import sparse, stats
+
+from exclusions import apply_exclusions
+from instrumentation import instrument
+from stimulus_features import attach_features
+
+# Groups compared for differential item functioning: the reference group and the group tested against it
+reference_group = 'Desktop'
+focal_group = 'VR'
+
+# Participants are matched on their total score in this many bands before the groups are compared per item
+score_bands = 4
+
+# Flag an item when the Mantel-Haenszel test is significant and the ETS delta is at least moderate (category B or C)
+alpha = 0.05
+min_delta = 1.0
+
+
+# Participant x item matrices of one trial table: trials seen, correct answers and summed reaction times
+# Rows are participants (Rendering, Participant ID), columns are Sample Numbers
+def item_matrices(trials_df):
+    participants = trials_df.groupby(['Rendering', 'Participant ID'], sort=True).ngroup().to_numpy()
+    items, item_index = pd.factorize(trials_df['Sample Number'], sort=True)
+    shape = (participants.max() + 1, len(item_index))
+
+    def matrix(values):
+        return sparse.csr_matrix((values, (participants, items)), shape=shape)
+
+    correct = trials_df['Correctness'].astype(bool).to_numpy(dtype=float)
+    matrices = {
+        'seen': matrix(np.ones(len(trials_df))),
+        'correct': matrix(correct),
+        'reaction time': matrix(trials_df['Reaction Time'].to_numpy(dtype=float)),
+    }
+    renderings = trials_df.groupby(['Rendering', 'Participant ID'], sort=True)['Rendering'].first().to_numpy()
+    return matrices, renderings, item_index
+
+
+# Pearson correlation from sums over n pairs, for every item at once
+def correlation(n, sx, sy, sxy, sxx, syy):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (n * sxy - sx * sy) / np.sqrt((n * sxx - sx ** 2) * (n * syy - sy ** 2))
+
+
+# Difficulty, discrimination and mean RT of every item from the participant x item matrices
+# Discrimination is the point-biserial correlation of an item with the participant's proportion correct on the
+# other items they saw (the rest score), so the item does not correlate with itself
+def item_statistics(matrices):
+    seen, correct, reaction_time = matrices['seen'], matrices['correct'], matrices['reaction time']
+    n = np.asarray(seen.sum(axis=0)).ravel()
+    n_correct = np.asarray(correct.sum(axis=0)).ravel()
+
+    # Per participant: correct answers and items seen, and the scale of the rest score
+    totals = np.asarray(correct.sum(axis=1)).ravel()
+    counts = np.asarray(seen.sum(axis=1)).ravel()
+    with np.errstate(divide='ignore'):
+        scale = np.where(counts > 1, 1 / (counts - 1), 0.0)
+
+    # Sums over the participants who saw each item, with y = (total - x) * scale and x in {0, 1}
+    sum_y = seen.T @ (totals * scale) - correct.T @ scale
+    sum_xy = correct.T @ (totals * scale) - correct.T @ scale
+    sum_yy = seen.T @ (totals ** 2 * scale ** 2) - 2 * correct.T @ (totals * scale ** 2) + correct.T @ scale ** 2
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return pd.DataFrame({
+            'Trials': n.astype(int),
+            'Difficulty': 1 - n_correct / n,
+            'Discrimination': correlation(n, n_correct, sum_y, sum_xy, n_correct, sum_yy),
+            'Mean Reaction Time': np.asarray(reaction_time.sum(axis=0)).ravel() / n,
+        })
+
+
+# Error rate and mean RT of every item in every Rendering x Condition cell, from one item x cell sparse product
+def cell_statistics(trials_df, item_index):
+    items = item_index.get_indexer(trials_df['Sample Number'])
+    cells, cell_index = pd.factorize(pd.MultiIndex.from_frame(trials_df[['Rendering', 'Condition']]), sort=True)
+    shape = (len(item_index), len(cell_index))
+
+    values = np.column_stack([np.ones(len(trials_df)), 1 - trials_df['Correctness'].astype(bool).to_numpy(dtype=float),
+                              trials_df['Reaction Time'].to_numpy(dtype=float)])
+    sums = [sparse.csr_matrix((values[:, i], (items, cells)), shape=shape).toarray() for i in range(values.shape[1])]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        error, reaction_time = sums[1] / sums[0], sums[2] / sums[0]
+
+    names = [f'{rendering} {condition}' for rendering, condition in cell_index]
+    return pd.concat([pd.DataFrame(error, columns=[f'Error {name}' for name in names]),
+                      pd.DataFrame(reaction_time, columns=[f'Reaction Time {name}' for name in names])], axis=1)
+
+
+# Mantel-Haenszel differential item functioning between two groups matched on total score: for every item the
+# 2 x 2 tables (group x correct) of all score bands come from two sparse products with a band indicator matrix
+def differential_functioning(matrices, renderings, reference=reference_group, focal=focal_group, bands=score_bands):
+    seen, correct = matrices['seen'], matrices['correct']
+    totals = np.asarray(correct.sum(axis=1)).ravel() / np.asarray(seen.sum(axis=1)).ravel()
+    band = pd.qcut(pd.Series(totals).rank(method='first'), bands, labels=False).to_numpy()
+
+    in_groups = np.isin(renderings, [reference, focal])
+    group = (renderings == focal).astype(int)
+    columns = band * 2 + group
+    indicator = sparse.csr_matrix((in_groups.astype(float), (np.arange(len(renderings)), columns)), shape=(len(renderings), bands * 2))
+
+    # items x (band, group) counts of trials and correct answers
+    n = (seen.T @ indicator).toarray().reshape(-1, bands, 2)
+    right = (correct.T @ indicator).toarray().reshape(-1, bands, 2)
+    wrong = n - right
+    a, b = right[..., 0], wrong[..., 0]  # reference group
+    c, d = right[..., 1], wrong[..., 1]  # focal group
+    total = n.sum(axis=2)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(total > 0, 1 / total, 0)
+        odds_ratio = (a * d * weight).sum(axis=1) / (b * c * weight).sum(axis=1)
+        expected = np.where(total > 0, n[..., 0] * (a + c) * weight, 0).sum(axis=1)
+        variance = np.where(total > 1, n[..., 0] * n[..., 1] * (a + c) * (b + d) / (total ** 2 * (total - 1)), 0).sum(axis=1)
+        chi_square = (np.abs(a.sum(axis=1) - expected) - 0.5) ** 2 / variance
+
+    # ETS delta: negative values mean the item is harder for the focal group than its total score predicts
+    delta = -2.35 * np.log(odds_ratio)
+    p_value = stats.chi2.sf(chi_square, 1)
+    return pd.DataFrame({
+        f'Difficulty {reference}': 1 - right[..., 0].sum(axis=1) / n[..., 0].sum(axis=1),
+        f'Difficulty {focal}': 1 - right[..., 1].sum(axis=1) / n[..., 1].sum(axis=1),
+        'MH Odds Ratio': odds_ratio, 'MH Delta': delta, 'MH Chi Square': chi_square, 'MH p-value': p_value,
+        'Flagged': (p_value < alpha) & (np.abs(delta) >= min_delta),
+    })
+
+
+# One row per Sample Number with all item statistics and the path complexity of the stimulus
+@instrument('test/item analysis')
+def item_analysis(trials_df):
+    matrices, renderings, item_index = item_matrices(trials_df)
+    table = pd.concat([
+        pd.DataFrame({'Sample Number': item_index}),
+        item_statistics(matrices),
+        differential_functioning(matrices, renderings),
+        cell_statistics(trials_df, item_index),
+    ], axis=1)
+    return attach_features(table)
+
+
+def main(path='combined_results.csv', output='item_analysis.csv'):
+    trials_df = apply_exclusions(pd.read_csv(path), 'trials')
+    table = item_analysis(trials_df)
+    table.to_csv(output, index=False)
+
+    print(f"{len(table)} items, {trials_df.groupby(['Rendering', 'Participant ID']).ngroups} participants")
+    print("\nHardest items:")
+    print(table.nlargest(10, 'Difficulty')[['Sample Number', 'Difficulty', 'Discrimination', 'Mean Reaction Time', 'Turns', 'Foil Divergence Index']].round(3).to_string(index=False))
+    print("\nItems that do not discriminate (point-biserial below 0.1):")
+    print(table.loc[table['Discrimination'] < 0.1, ['Sample Number', 'Difficulty', 'Discrimination']].round(3).to_string(index=False))
+    print(f"\nItems behaving differently in {focal_group} than in {reference_group}:")
+    print(table.loc[table['Flagged'], ['Sample Number', f'Difficulty {reference_group}', f'Difficulty {focal_group}', 'MH Delta', 'MH p-value']].round(3).to_string(index=False))
+    print("\nDifficulty and the path complexity of the stimulus:")
+    print(table[['Difficulty', 'Mean Reaction Time', 'Turns', 'Path Extent', 'Backtracks', 'Foil Divergence Index']].corr().round(2).iloc[:2].to_string())
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -3,6 +3,8 @@ from scipy.stats import kruskal, f_oneway, levene, shapiro
 from statsmodels.formula.api import ols
 import statsmodels.api as sm
 
+from instrumentation import stage
+
 # Load the combined dataset
 combined_data = pd.read_csv('data.csv')
 
@@ -58,4 +60,5 @@ modality_types = combined_data['Modality'].unique()
 
 for immersion in immersion_types:
     for modality in modality_types:
-        analyze_modality(combined_data, immersion, modality)
+        with stage(f'test/learning effects {immersion} {modality}', rows=len(combined_data)):
+            analyze_modality(combined_data, immersion, modality)
@@ -3,6 +3,9 @@ import statsmodels.formula.api as smf
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from instrumentation import stage
+from stimulus_features import attach_features
+
 # Load the data
 file_path = 'data.csv'
 data = pd.read_csv(file_path)
@@ -23,8 +26,9 @@ for modality in modalities:
     modality_data = data[data['Modality'] == modality]
     
     # Fit the logistic regression model
-    model = smf.logit("Correctness ~ Immersion", data=modality_data)
-    result = model.fit()
+    with stage(f'model/logit {modality}', rows=len(modality_data)):
+        model = smf.logit("Correctness ~ Immersion", data=modality_data)
+        result = model.fit()
     logit_results[modality] = result.summary2().tables[1]
 
 # Combine the logistic regression results into one DataFrame for easier comparison
@@ -40,4 +44,20 @@ logit_summary_df['[0.025'] = logit_summary_df['[0.025'].apply(lambda x: f"{x:.2f
 logit_summary_df['0.975]'] = logit_summary_df['0.975]'].apply(lambda x: f"{x:.2f}")
 
 # Print the formatted logistic regression summary
-print(logit_summary_df)
\ No newline at end of file
+print(logit_summary_df)
+
+# Path complexity of the stimulus of every trial, looked up by SampleNumber (e.g. 'Foil Divergence Index' -> FoilDivergenceIndex)
+data = attach_features(data, sample_column='SampleNumber', rename=lambda x: x.replace(' ', ''))
+complexity_covariates = ['Turns', 'PathExtent', 'Backtracks', 'FoilDivergenceIndex']
+
+# Fit the same models with path complexity as covariates
+covariate_results = {}
+for modality in modalities:
+    modality_data = data[data['Modality'] == modality]
+    with stage(f'model/logit {modality} with complexity', rows=len(modality_data)):
+        model = smf.logit("Correctness ~ Immersion + " + " + ".join(complexity_covariates), data=modality_data)
+        result = model.fit(disp=False)
+    covariate_results[modality] = result.summary2().tables[1]
+
+print("\nLogistic regression with path complexity covariates:")
+print(pd.concat(covariate_results, axis=0, keys=covariate_results.keys()).round(3))
\ No newline at end of file
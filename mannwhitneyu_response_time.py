@@ -1,6 +1,8 @@
 from scipy.stats import mannwhitneyu
 import pandas as pd
 
+from instrumentation import stage
+
 # Load the data from the uploaded CSV file
 file_path = 'data.csv'
 data = pd.read_csv(file_path)
@@ -23,7 +25,8 @@ def mann_whitney_test(data, modality):
 results = {}
 modalities = ['H', 'V', 'VH']
 for modality in modalities:
-    results[modality] = mann_whitney_test(data, modality)
+    with stage(f'test/mann-whitney {modality}', rows=len(data)):
+        results[modality] = mann_whitney_test(data, modality)
 
 # Display the results in a formatted DataFrame
 results_df = pd.DataFrame(results, index=['Statistic', 'p-value']).T
@@ -0,0 +1,201 @@
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from CombineVRandDesktopResults import list_result_files
+from probe_data import folders, load_trials, participant_id
+
+# Accumulators of every Rendering x Condition cell and of every participant folded into them
+state_path = 'online_statistics.json'
+
+measures = ['Error', 'Reaction Time']
+
+
+# Count, mean and sum of squared deviations (Welford); batches are merged and taken out again with
+# the pairwise update of Chan et al., so adding or removing n values costs O(n)
+class RunningStats:
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    @classmethod
+    def from_values(cls, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return cls()
+        mean = values.mean()
+        return cls(len(values), mean, float(((values - mean) ** 2).sum()))
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        return self
+
+    # Inverse of merge: the statistics without the values summarised by other
+    def retract(self, other):
+        if other.count == 0:
+            return self
+        if other.count > self.count:
+            raise ValueError(f"Cannot retract {other.count} values from {self.count}")
+        count = self.count - other.count
+        if count == 0:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return self
+        mean = (self.count * self.mean - other.count * other.mean) / count
+        delta = other.mean - mean
+        self.m2 = max(self.m2 - other.m2 - delta ** 2 * count * other.count / self.count, 0.0)
+        self.mean = mean
+        self.count = count
+        return self
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    def to_list(self):
+        return [self.count, self.mean, self.m2]
+
+
+# Running descriptives per (rendering, condition), together with the contribution of every participant
+# so that a participant can be taken out again without rereading anything
+class OnlineDescriptives:
+    def __init__(self):
+        self.cells = {}
+        self.participants = {}
+
+    def cell(self, key):
+        if key not in self.cells:
+            self.cells[key] = {measure: RunningStats() for measure in measures}
+        return self.cells[key]
+
+    # Fold in the trials of one participant; a participant already included raises ValueError
+    def add_participant(self, rendering, participant, trials_df, signature=None):
+        key = f'{rendering}/{participant}'
+        if key in self.participants:
+            raise ValueError(f"Participant {key} is already included")
+
+        contribution = {}
+        for condition, group in trials_df.groupby('Condition'):
+            stats = {measure: RunningStats.from_values(group[measure]) for measure in measures}
+            for measure, partial in stats.items():
+                self.cell((rendering, condition))[measure].merge(partial)
+            contribution[condition] = {measure: partial.to_list() for measure, partial in stats.items()}
+        self.participants[key] = {'signature': signature, 'cells': contribution}
+
+    def retract_participant(self, rendering, participant):
+        key = f'{rendering}/{participant}'
+        if key not in self.participants:
+            raise ValueError(f"Participant {key} is not included")
+        for condition, stats in self.participants.pop(key)['cells'].items():
+            for measure, values in stats.items():
+                self.cell((rendering, condition))[measure].retract(RunningStats(*values))
+
+    # Current descriptives of every cell
+    def descriptives(self):
+        rows = []
+        for (rendering, condition), stats in sorted(self.cells.items()):
+            participants = sum(key.startswith(f'{rendering}/') and condition in entry['cells'] for key, entry in self.participants.items())
+            rows.append({
+                'Rendering': rendering, 'Condition': condition, 'Participants': participants, 'Trials': stats['Error'].count,
+                'Error Rate': stats['Error'].mean, 'Error SD': np.sqrt(stats['Error'].variance),
+                'Reaction Time Mean': stats['Reaction Time'].mean, 'Reaction Time SD': np.sqrt(stats['Reaction Time'].variance),
+            })
+        return pd.DataFrame(rows)
+
+    def save(self, path=state_path):
+        state = {
+            'cells': {f'{rendering}/{condition}': {measure: stats.to_list() for measure, stats in cell.items()}
+                      for (rendering, condition), cell in self.cells.items()},
+            'participants': self.participants,
+        }
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.json', delete=False) as tmp:
+            json.dump(state, tmp, indent=1)
+        os.replace(tmp.name, path)
+
+    @classmethod
+    def load(cls, path=state_path):
+        descriptives = cls()
+        with open(path) as f:
+            state = json.load(f)
+        for name, cell in state['cells'].items():
+            rendering, condition = name.split('/')
+            descriptives.cells[(rendering, condition)] = {measure: RunningStats(*values) for measure, values in cell.items()}
+        descriptives.participants = state['participants']
+        return descriptives
+
+
+# The trials of one participant file as ingest sees them: reaction times, conditions from trials.csv and
+# only the latest attempt of a retried trial
+def read_participant(file, trials_df):
+    df = pd.read_csv(file)
+    df.rename(columns=lambda x: x.strip(), inplace=True)
+    start = pd.to_datetime(df['Start Timestamp'])
+    end = pd.to_datetime(df['End Timestamp'])
+    df['Reaction Time'] = (end - start).dt.total_seconds()
+    df['End Timestamp'] = end
+
+    df = df.merge(trials_df[['Participant ID', 'Trial Number', 'Condition']], on=['Participant ID', 'Trial Number'], how='left')
+    df = df.sort_values(['Trial Number', 'End Timestamp'], ascending=[True, False]).drop_duplicates('Trial Number')
+    df['Error'] = 1 - df['Correctness'].astype(bool).astype(int)
+    return df.dropna(subset=['Condition'])
+
+
+# Result file of every participant, found the way ingest finds them (no probe files, no trials.csv)
+def participant_files(folder):
+    return {participant_id(file): file for file in list_result_files(folder)}
+
+
+def signature(file):
+    stat = os.stat(file)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+# Bring the accumulators in line with the folders: fold in new participant files, retract participants
+# whose file is gone (e.g. moved to removed/) and redo participants whose file changed
+def sync(descriptives, folders=folders, trials_path='trials.csv'):
+    trials_df = None
+    added, retracted = [], []
+    for folder in folders:
+        files = participant_files(folder)
+        included = {int(key.split('/')[1]) for key in descriptives.participants if key.split('/')[0] == folder}
+
+        for participant in sorted(included):
+            file = files.get(participant)
+            if file is None or descriptives.participants[f'{folder}/{participant}']['signature'] != signature(file):
+                descriptives.retract_participant(folder, participant)
+                retracted.append(f'{folder}/{participant}')
+                included.discard(participant)
+
+        for participant, file in sorted(files.items()):
+            if participant in included:
+                continue
+            if trials_df is None:
+                trials_df = load_trials(trials_path)
+            descriptives.add_participant(folder, participant, read_participant(file, trials_df), signature(file))
+            added.append(f'{folder}/{participant}')
+    return added, retracted
+
+
+def main(path=state_path):
+    descriptives = OnlineDescriptives.load(path) if os.path.exists(path) else OnlineDescriptives()
+    added, retracted = sync(descriptives)
+    descriptives.save(path)
+
+    print(f"Added {len(added)} participants, retracted {len(retracted)}, {len(descriptives.participants)} included")
+    print(descriptives.descriptives().round(3).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,330 @@
+import ast
+import csv
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+# Hashes of the inputs and outputs of every stage at its last successful run
+state_path = '.pipeline_state.json'
+
+# Stage logs, the per-stage timing history and the instrumentation timeline of every script (reports/timeline)
+reports_dir = 'reports'
+timings_path = os.path.join(reports_dir, 'pipeline_timings.csv')
+
+python = sys.executable
+
+# Every stage of the ingest-to-report workflow, with the data files it reads and the files it writes
+# The Python modules a stage runs are found from the imports of its script (see local_modules), so only data files
+# are listed here
+# The analysis scripts only print their results; the paper figures are written by figure_pipeline.py alone
+stages = [
+    {
+        'name': 'integrity',
+        'command': [python, 'timestamp_integrity.py'],
+        'inputs': ['VR/*.csv', 'Desktop/*.csv'],
+        'outputs': ['timestamp_integrity.csv'],
+    },
+    {
+        'name': 'ingest',
+        'command': [python, 'CombineVRandDesktopResults.py'],
+        'inputs': ['trials.csv', 'VR/*.csv', 'Desktop/*.csv'],
+        'outputs': ['combined_results.csv'],
+    },
+    {
+        'name': 'export',
+        'command': [python, 'export_results.py'],
+        'inputs': ['combined_results.csv'],
+        'outputs': ['data.csv', 'combined_results_r.csv'],
+    },
+    {
+        'name': 'store',
+        'command': [python, 'trial_store.py'],
+        'inputs': ['combined_results.csv', 'trajectory_similarity.csv', 'probe_quality.csv', 'VR/*.csv', 'Desktop/*.csv'],
+        'outputs': ['trials.sqlite'],
+    },
+    {
+        'name': 'ex_gaussian',
+        'command': [python, 'ex_gaussian.py'],
+        'inputs': ['combined_results.csv'],
+        'outputs': ['ex_gaussian.csv'],
+    },
+    {
+        'name': 'ez_diffusion',
+        'command': [python, 'ez_diffusion.py'],
+        'inputs': ['combined_results.csv'],
+        'outputs': ['ez_diffusion.csv'],
+    },
+    {
+        'name': 'art_anova',
+        'command': ['Rscript', 'art_anova.r'],
+        'inputs': ['art_anova.r', 'data.csv'],
+        'outputs': ['anova_results_error_rate.csv', 'anova_results_reaction_time.csv', 'anova_results_combined.csv'],
+    },
+    {
+        'name': 'joint_anova',
+        'command': [python, 'joint_data_analysis.py'],
+        'inputs': ['combined_results.csv', 'ex_gaussian.csv', 'ez_diffusion.csv'],
+        'outputs': [],
+    },
+    {
+        'name': 'interaction_models',
+        'command': [python, 'interaction_analysis.py'],
+        'inputs': ['combined_results.csv', 'trials.csv', 'ex_gaussian.csv', 'ez_diffusion.csv'],
+        'outputs': [],
+    },
+    {
+        'name': 'learning_effects',
+        'command': [python, 'combined_learning_effects.py'],
+        'inputs': ['data.csv'],
+        'outputs': [],
+    },
+    {
+        'name': 'learning_effects_per_modality',
+        'command': [python, 'learning_effects_per_modality.py'],
+        'inputs': ['data.csv'],
+        'outputs': [],
+    },
+    {
+        'name': 'logistic_regression',
+        'command': [python, 'logistic_regression_error_rates.py'],
+        'inputs': ['data.csv', 'trials.csv'],
+        'outputs': [],
+    },
+    {
+        'name': 'mannwhitneyu',
+        'command': [python, 'mannwhitneyu_response_time.py'],
+        'inputs': ['data.csv'],
+        'outputs': [],
+    },
+    {
+        'name': 'sequential_effects',
+        'command': [python, 'sequential_effects.py'],
+        'inputs': ['combined_results.csv'],
+        'outputs': [],
+    },
+    {
+        'name': 'nasa_tlx',
+        'command': [python, 'nasa_tlx.py'],
+        'inputs': ['NASA TLX/*.csv', 'combined_results.csv'],
+        'outputs': [],
+    },
+    {
+        'name': 'figures',
+        'command': [python, 'figure_pipeline.py'],
+        'inputs': ['combined_results.csv', 'data.csv', 'NASA TLX/*.csv'],
+        'outputs': ['joint_error_rate.pdf', 'joint_response_time.pdf', 'interaction_plots.pdf', 'learning_effects_plots.pdf', 'nasa_tlx_scores.pdf'],
+    },
+]
+
+# Data files read by the local modules themselves, whichever stage imports them
+module_inputs = {
+    'exclusions.py': ['exclusions.csv'],
+}
+
+
+def log_path(stage):
+    return os.path.join(reports_dir, stage['name'] + '.log')
+
+
+def expand(patterns):
+    files = []
+    for pattern in patterns:
+        files.extend(sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern])
+    return files
+
+
+# Content hash of a file, reusing the recorded hash while its size and modification time are unchanged
+def file_hash(path, known):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    record = known.get(path)
+    if record and record[0] == stat.st_mtime_ns and record[1] == stat.st_size:
+        return record[2]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    known[path] = [stat.st_mtime_ns, stat.st_size, digest.hexdigest()]
+    return known[path][2]
+
+
+# Edges from every stage to the stages that produce its inputs
+def build_graph(stages):
+    producers = {output: stage['name'] for stage in stages for output in stage['outputs']}
+    graph = {}
+    for stage in stages:
+        graph[stage['name']] = {producers[path] for path in stage['inputs'] if path in producers and producers[path] != stage['name']}
+
+    # Reject cycles before anything runs
+    visiting, done = set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Pipeline has a cycle through stage '{name}'")
+        visiting.add(name)
+        for dependency in graph[name]:
+            visit(dependency)
+        visiting.discard(name)
+        done.add(name)
+
+    for name in graph:
+        visit(name)
+    return graph
+
+
+# The script of a Python stage and every local module it imports, directly or through other local modules, including
+# imports inside functions
+def local_modules(script, found=None):
+    found = [] if found is None else found
+    found.append(script)
+    for node in ast.walk(ast.parse(open(script).read(), script)):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            path = os.path.join(os.path.dirname(script), name.split('.')[0] + '.py')
+            if os.path.exists(path) and path not in found:
+                local_modules(path, found)
+    return found
+
+
+def stage_inputs(stage):
+    script = stage['command'][1]
+    modules = local_modules(script) if stage['command'][0] == python and os.path.exists(script) else []
+    return modules + [path for module in modules for path in module_inputs.get(os.path.basename(module), [])] + stage['inputs']
+
+
+def fingerprint(stage, known):
+    inputs = {path: file_hash(path, known) for path in expand(stage_inputs(stage))}
+    outputs = {path: file_hash(path, known) for path in stage['outputs'] + [log_path(stage)]}
+    return {'command': stage['command'][1:], 'inputs': inputs, 'outputs': outputs}
+
+
+# A stage is up to date when its command, inputs and outputs all match its last successful run
+def up_to_date(stage, state, known):
+    recorded = state.get(stage['name'])
+    current = fingerprint(stage, known)
+    if recorded is None or None in current['outputs'].values():
+        return False
+    return recorded == current
+
+
+def load_state():
+    state = json.load(open(state_path)) if os.path.exists(state_path) else {}
+    return state, state.pop('_hashes', {})
+
+
+def save_state(state, known):
+    state['_hashes'] = known
+    with open(state_path, 'w') as f:
+        json.dump(state, f, indent=1)
+
+
+# Record stages as up to date without running them, after their outputs were brought up to date another way
+def mark_current(names, stages=stages):
+    state, known = load_state()
+    for stage in stages:
+        if stage['name'] in names:
+            state[stage['name']] = fingerprint(stage, known)
+    save_state(state, known)
+
+
+def run_stage(stage):
+    os.makedirs(reports_dir, exist_ok=True)
+    env = dict(os.environ, MPLBACKEND='Agg', ANALYSIS_TIMELINE=os.path.join(reports_dir, 'timeline'))
+    start = time.perf_counter()
+    with open(log_path(stage), 'w') as log:
+        try:
+            process = subprocess.Popen(stage['command'], stdout=log, stderr=subprocess.STDOUT, env=env)
+        except FileNotFoundError:
+            log.write(f"Command not found: {stage['command'][0]}\n")
+            return 127, time.perf_counter() - start, 0.0
+
+        # Wait on this child alone so its CPU time is not mixed up with stages running in parallel
+        _, wait_status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(wait_status)
+    return process.returncode, time.perf_counter() - start, usage.ru_utime + usage.ru_stime
+
+
+# Run the stages that are out of date, in dependency order, with independent stages in parallel
+def run(stages=stages, force=False, max_workers=None):
+    graph = build_graph(stages)
+    by_name = {stage['name']: stage for stage in stages}
+
+    state, known = load_state()
+
+    status = {}
+    running = {}
+    timings = []
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        while len(status) < len(stages):
+            for name, dependencies in graph.items():
+                if name in status or name in running.values():
+                    continue
+                if any(status.get(dependency) in ('failed', 'blocked') for dependency in dependencies):
+                    status[name] = 'blocked'
+                    continue
+                if not all(dependency in status for dependency in dependencies):
+                    continue
+
+                # Decided only once the stages it depends on are finished, since they may have changed its inputs
+                if not force and up_to_date(by_name[name], state, known):
+                    status[name] = 'skipped'
+                    timings.append((name, 'skipped', 0.0, 0.0))
+                else:
+                    running[executor.submit(run_stage, by_name[name])] = name
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                returncode, wall, cpu = future.result()
+                if returncode == 0:
+                    status[name] = 'ran'
+                    state[name] = fingerprint(by_name[name], known)
+                else:
+                    status[name] = 'failed'
+                    state.pop(name, None)
+                timings.append((name, status[name], wall, cpu))
+                print(f"{name}: {status[name]} in {wall:.2f} s")
+
+    save_state(state, known)
+    record_timings(timings)
+    return status
+
+
+def record_timings(timings):
+    os.makedirs(reports_dir, exist_ok=True)
+    new_file = not os.path.exists(timings_path)
+    started = datetime.now().isoformat(timespec='seconds')
+    with open(timings_path, 'a', newline='') as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(['Run', 'Stage', 'Status', 'Wall Time', 'CPU Time'])
+        for name, status, wall, cpu in timings:
+            writer.writerow([started, name, status, f'{wall:.3f}', f'{cpu:.3f}'])
+
+
+def main():
+    status = run(force='--force' in sys.argv)
+    for name, result in status.items():
+        if result in ('failed', 'blocked'):
+            print(f"{name}: {result}, see {log_path({'name': name})}")
+
+
+if __name__ == '__main__':
+    main()
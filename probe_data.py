@@ -0,0 +1,66 @@
+import ast
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+# Define the folders written by the experiment, one per display environment, in the order of their blocks of
+# participant IDs; every script takes its groups from here, and ANALYSIS_GROUPS (comma separated) names other folders
+folders = os.environ.get('ANALYSIS_GROUPS', 'VR,Desktop').split(',')
+
+# Columns written by the probe logger
+probe_columns = ['Trial Number', 'Trial Phase', 'Time', 'Position X', 'Position Y', 'Position Z']
+position_columns = ['Position X', 'Position Y', 'Position Z']
+
+# Path and Foil cells live on a square grid of this size
+grid_size = 5
+
+
+# Get the participant ID from a '<folder>/<id>.csv' or '<folder>/<id>_probedata.csv' filename
+def participant_id(file):
+    return int(os.path.basename(file).split('_')[0].split('.')[0])
+
+
+# Get a list of all probe files in the folder, sorted by participant ID
+def list_probe_files(folder):
+    probe_files = glob.glob(f'{folder}/*_probedata.csv')
+    probe_files.sort(key=participant_id)
+    return probe_files
+
+
+# Read a probe file, strip spaces from the column names and drop rows that are not numeric
+def read_probe_file(file):
+    df = pd.read_csv(file)
+    df.rename(columns=lambda x: x.strip(), inplace=True)
+    df = df[probe_columns].apply(pd.to_numeric, errors='coerce').dropna()
+    return df.astype({'Trial Number': int, 'Trial Phase': int, 'Time': float, **{column: float for column in position_columns}})
+
+
+# Read every probe file of the folders into one DataFrame tagged with Rendering and Participant ID
+# participants limits the files read to these participant IDs
+def load_probe_data(folders=folders, participants=None):
+    dfs = []
+    for folder in folders:
+        for file in list_probe_files(folder):
+            if participants is not None and participant_id(file) not in participants:
+                continue
+            df = read_probe_file(file)
+            df['Rendering'] = folder
+            df['Participant ID'] = participant_id(file)
+            dfs.append(df)
+    if not dfs:
+        empty = pd.DataFrame(columns=probe_columns + ['Rendering', 'Participant ID'])
+        return empty.astype({'Trial Number': int, 'Trial Phase': int, 'Participant ID': int, 'Rendering': str,
+                             'Time': float, **{column: float for column in position_columns}})
+    return pd.concat(dfs, ignore_index=True)
+
+
+# Load the trials.csv into a DataFrame, stripping spaces from the column names
+def load_trials(path='trials.csv'):
+    return pd.read_csv(path).rename(columns=lambda x: x.strip())
+
+
+# Decode a Path or Foil string such as "[(0, 4), (0, 3), ...]" into an (n, 2) array of grid cells
+def parse_path(text):
+    return np.array(ast.literal_eval(text), dtype=np.int8).reshape(-1, 2)
@@ -0,0 +1,195 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from probe_data import folders, list_probe_files, load_trials, participant_id, read_probe_file
+
+# Probe axes binned into the heatmaps and the number of bins per axis
+heatmap_axes = ['Position X', 'Position Y']
+bins = 64
+
+# Range of the heatmaps of every rendering: the smallest and largest sample of its probe files, rounded outwards to
+# this step. Each rendering is binned over its own range, so a rendering that covers less of the space is not squashed
+# into a few bins of a range shared with the other
+bounds_step = 0.1
+
+# Fixed ranges that replace the ones found in the data, e.g. {'VR': {'Position X': (-2.6, 3.3), 'Position Y': (-1.2, 0.9)}}
+bounds_override = {}
+
+
+# Fixed-size count grids per (rendering, condition, phase), built up one participant at a time
+class HeatmapAccumulator:
+    def __init__(self, axes=heatmap_axes, bins=bins, bounds=None):
+        self.axes = list(axes)
+        self.bins = bins
+        self.bounds = dict(bounds or {})
+        self.edges = {}
+        self.grids = {}
+        self.participants = set()
+
+    # Bin edges of every axis for one rendering, fixed by its bounds the first time the rendering is counted; samples
+    # of participants added later that fall outside them are not counted
+    def edges_for(self, rendering):
+        if rendering not in self.edges:
+            if rendering not in self.bounds:
+                raise ValueError(f"No heatmap bounds for rendering '{rendering}'")
+            self.edges[rendering] = [np.linspace(*self.bounds[rendering][axis], self.bins + 1) for axis in self.axes]
+        return self.edges[rendering]
+
+    def grid(self, key):
+        if key not in self.grids:
+            self.grids[key] = np.zeros((self.bins, self.bins), dtype=np.int64)
+        return self.grids[key]
+
+    # Fold the samples of one participant into the grids; a participant already counted is skipped
+    def add_participant(self, rendering, participant, probe_df, conditions):
+        if (rendering, participant) in self.participants:
+            return False
+
+        probe_df = probe_df.assign(Condition=probe_df['Trial Number'].map(conditions)).dropna(subset=['Condition'])
+        for (condition, phase), group in probe_df.groupby(['Condition', 'Trial Phase']):
+            counts, _, _ = np.histogram2d(group[self.axes[0]], group[self.axes[1]], bins=self.edges_for(rendering))
+            self.grid((rendering, condition, int(phase)))[:] += counts.astype(np.int64)
+
+        self.participants.add((rendering, participant))
+        return True
+
+    # Add the counts of another accumulator, e.g. a partial result from a worker process
+    def merge(self, other):
+        if other.axes != self.axes or other.bins != self.bins:
+            raise ValueError("Cannot merge heatmaps with different axes or bins")
+        for rendering in self.edges.keys() & other.edges.keys():
+            if not all(np.array_equal(a, b) for a, b in zip(self.edges[rendering], other.edges[rendering])):
+                raise ValueError(f"Cannot merge heatmaps of {rendering} with different bounds")
+        overlap = self.participants & other.participants
+        if overlap:
+            raise ValueError(f"Participants counted twice: {sorted(overlap)}")
+        for key, counts in other.grids.items():
+            self.grid(key)[:] += counts
+        self.participants |= other.participants
+        for rendering, edges in other.edges.items():
+            self.edges.setdefault(rendering, edges)
+        return self
+
+    def save(self, path):
+        grids = {'grid/' + '/'.join(map(str, key)): counts for key, counts in self.grids.items()}
+        edges = {f'edges/{rendering}': np.array(axis_edges) for rendering, axis_edges in self.edges.items()}
+        participants = np.array([f'{rendering}/{participant}' for rendering, participant in sorted(self.participants)], dtype=str)
+        np.savez_compressed(path, axes=np.array(self.axes), bins=self.bins, participants=participants, **grids, **edges)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            accumulator = cls(axes=[str(axis) for axis in data['axes']], bins=int(data['bins']))
+            for name in data.files:
+                if name.startswith('grid/'):
+                    rendering, condition, phase = name.split('/')[1:]
+                    accumulator.grids[(rendering, condition, int(phase))] = data[name].astype(np.int64)
+                elif name.startswith('edges/'):
+                    accumulator.edges[name.split('/')[1]] = list(data[name])
+            for entry in data['participants']:
+                rendering, participant = str(entry).split('/')
+                accumulator.participants.add((rendering, int(participant)))
+        return accumulator
+
+
+# Smallest and largest sample of every heatmap axis in one probe file, read in a worker process; None for a file
+# without samples
+def probe_range(file):
+    probe_df = read_probe_file(file)
+    if probe_df.empty:
+        return None
+    return {axis: (probe_df[axis].min(), probe_df[axis].max()) for axis in heatmap_axes}
+
+
+# Bounds of one rendering covering the ranges of all its files, rounded outwards to bounds_step
+def rendering_bounds(ranges, step=bounds_step):
+    ranges = [r for r in ranges if r is not None]
+    if not ranges:
+        return None
+    bounds = {}
+    for axis in heatmap_axes:
+        low, high = min(r[axis][0] for r in ranges), max(r[axis][1] for r in ranges)
+        bounds[axis] = (round(np.floor(low / step) * step, 6), round(np.ceil(high / step) * step, 6))
+    return bounds
+
+
+# Build the partial heatmaps of one participant file in a worker process
+def participant_heatmaps(job):
+    folder, file, conditions, bounds = job
+    accumulator = HeatmapAccumulator(bounds={folder: bounds} if bounds else None)
+    accumulator.add_participant(folder, participant_id(file), read_probe_file(file), conditions)
+    return accumulator
+
+
+# Draw the normalized heatmap of every (rendering, condition, phase) into one PDF
+def plot_heatmaps(accumulator, path='probe_heatmaps.pdf'):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    keys = sorted(accumulator.grids)
+    renderings = sorted({key[0] for key in keys})
+    columns = sorted({key[1:] for key in keys})
+
+    fig, axs = plt.subplots(len(renderings), len(columns), figsize=(3 * len(columns), 3 * len(renderings)), squeeze=False)
+    for row, rendering in enumerate(renderings):
+        x_edges, y_edges = accumulator.edges_for(rendering)
+        extent = [x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]]
+        for column, (condition, phase) in enumerate(columns):
+            ax = axs[row, column]
+            counts = accumulator.grids.get((rendering, condition, phase))
+            if counts is not None and counts.sum() > 0:
+                ax.imshow((counts / counts.sum()).T, origin='lower', extent=extent, cmap='viridis')
+            ax.set_title(f'{rendering} {condition} (phase {phase})', fontsize=9)
+            ax.set_xticks([])
+            ax.set_yticks([])
+
+    plt.tight_layout()
+    plt.savefig(path, format='pdf')
+    plt.close(fig)
+
+
+def main(output='probe_heatmaps.npz', max_workers=None):
+    accumulator = HeatmapAccumulator.load(output) if os.path.exists(output) else HeatmapAccumulator()
+
+    # Condition of every trial, per participant
+    trials_df = load_trials()
+    conditions = {pid: dict(zip(group['Trial Number'], group['Condition'])) for pid, group in trials_df.groupby('Participant ID')}
+
+    # Only participants that are not in the saved grids yet need to be read
+    files = {folder: list_probe_files(folder) for folder in folders}
+    new_files = {folder: [file for file in files[folder] if (folder, participant_id(file)) not in accumulator.participants]
+                 for folder in folders}
+
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        # Renderings counted before keep the edges they were saved with; the others are binned over the range of all
+        # their files, unless bounds_override fixes it
+        for folder in folders:
+            if folder in accumulator.edges:
+                accumulator.bounds[folder] = {axis: (edges[0], edges[-1]) for axis, edges in zip(accumulator.axes, accumulator.edges[folder])}
+            elif folder in bounds_override:
+                accumulator.bounds[folder] = bounds_override[folder]
+            elif new_files[folder]:
+                bounds = rendering_bounds(list(executor.map(probe_range, files[folder])))
+                if bounds is not None:
+                    accumulator.bounds[folder] = bounds
+
+        jobs = [(folder, file, conditions.get(participant_id(file), {}), accumulator.bounds.get(folder))
+                for folder in folders for file in new_files[folder]]
+        if jobs:
+            for partial in executor.map(participant_heatmaps, jobs):
+                accumulator.merge(partial)
+            accumulator.save(output)
+
+    print(f"Added {len(jobs)} participants, {len(accumulator.participants)} in total")
+    for key in sorted(accumulator.grids):
+        print(key, accumulator.grids[key].sum())
+
+    plot_heatmaps(accumulator)
+    return accumulator
+
+
+if __name__ == '__main__':
+    main()
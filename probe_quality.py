@@ -0,0 +1,133 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from probe_data import folders, list_probe_files, participant_id, position_columns, probe_columns
+
+# Rows read from a probe file at a time
+chunksize = 50000
+
+# Steps between two samples longer than this (in seconds) count as a tracking gap; the logger runs at ~10 Hz
+gap_threshold = 0.5
+
+# A position held this long (in seconds) counts as a frozen tracker
+freeze_threshold = 1.0
+
+# Bounds of the tracked workspace per axis, slightly wider than the 1st-99th percentile of the recorded sessions
+workspace = {
+    'Position X': (-3.5, 3.5),
+    'Position Y': (-1.5, 1.5),
+    'Position Z': (-2.0, 2.5),
+}
+
+segment_columns = ['Trial Number', 'Trial Phase']
+
+# How the per-chunk partial results of a trial phase are merged
+merge_rules = {
+    'Samples': 'sum',
+    'Start': 'min',
+    'End': 'max',
+    'Max Gap': 'max',
+    'Gaps': 'sum',
+    'Non Monotonic': 'sum',
+    'Frozen Samples': 'sum',
+    'Longest Freeze': 'max',
+    'Out Of Range': 'sum',
+    'Runs': 'sum',
+}
+
+
+# Scan one probe file chunk by chunk, carrying only the last sample over the chunk boundaries
+def check_probe_file(job):
+    folder, file = job
+    lower = np.array([workspace[column][0] for column in position_columns])
+    upper = np.array([workspace[column][1] for column in position_columns])
+
+    partials = []
+    # Last row of the previous chunk: trial, phase, time, position and the start of its current freeze
+    carry = (-1, -1, np.nan, np.full(len(position_columns), np.nan), np.nan)
+
+    for chunk in pd.read_csv(file, chunksize=chunksize):
+        chunk.rename(columns=lambda x: x.strip(), inplace=True)
+        chunk = chunk[probe_columns].apply(pd.to_numeric, errors='coerce').dropna()
+        if chunk.empty:
+            continue
+
+        # Prepend the carried row so that every step, including the first one of the chunk, has a predecessor
+        trial = np.r_[carry[0], chunk['Trial Number'].to_numpy(dtype=int)]
+        phase = np.r_[carry[1], chunk['Trial Phase'].to_numpy(dtype=int)]
+        time = np.r_[carry[2], chunk['Time'].to_numpy(dtype=float)]
+        position = np.vstack([carry[3], chunk[position_columns].to_numpy(dtype=float)])
+
+        same = (trial[1:] == trial[:-1]) & (phase[1:] == phase[:-1])
+        step = np.diff(time)
+        frozen = same & (np.diff(position, axis=0) == 0).all(axis=1)
+
+        # Time at which the current frozen stretch started, forward-filled from the last moving sample
+        moving = np.r_[True, ~frozen]
+        anchor = np.maximum.accumulate(np.where(moving, np.arange(len(time)), 0))
+        anchor_time = time.copy()
+        anchor_time[0] = carry[4] if not np.isnan(carry[4]) else time[0]
+        freeze = np.where(frozen, time[1:] - anchor_time[anchor][1:], 0.0)
+
+        flags = pd.DataFrame({
+            'Trial Number': trial[1:],
+            'Trial Phase': phase[1:],
+            'Samples': 1,
+            'Start': time[1:],
+            'End': time[1:],
+            'Max Gap': np.where(same, step, 0.0),
+            'Gaps': same & (step > gap_threshold),
+            'Non Monotonic': same & (step <= 0),
+            'Frozen Samples': frozen,
+            'Longest Freeze': freeze,
+            'Out Of Range': ((position[1:] < lower) | (position[1:] > upper)).any(axis=1),
+            'Runs': ~same,
+        })
+        partials.append(flags.groupby(segment_columns).agg(merge_rules))
+
+        carry = (trial[-1], phase[-1], time[-1], position[-1], anchor_time[anchor][-1])
+
+    if not partials:
+        return pd.DataFrame()
+
+    quality_df = pd.concat(partials).groupby(level=segment_columns).agg(merge_rules).reset_index()
+    quality_df.insert(0, 'Participant ID', participant_id(file))
+    quality_df.insert(0, 'Rendering', folder)
+    return quality_df
+
+
+# Summarise the issues of every trial phase into one flag
+def flag_trials(quality_df):
+    quality_df['Flagged'] = (
+        (quality_df['Gaps'] > 0)
+        | (quality_df['Non Monotonic'] > 0)
+        | (quality_df['Longest Freeze'] >= freeze_threshold)
+        | (quality_df['Out Of Range'] > 0)
+        | (quality_df['Runs'] > 1)
+    )
+    return quality_df
+
+
+def main(output='probe_quality.csv', max_workers=None):
+    jobs = [(folder, file) for folder in folders for file in list_probe_files(folder)]
+
+    # One worker per participant file, each file is read exactly once
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        results = [df for df in executor.map(check_probe_file, jobs) if not df.empty]
+
+    quality_df = flag_trials(pd.concat(results, ignore_index=True))
+    quality_df.to_csv(output, index=False)
+
+    # Share of flagged trial phases per participant, so candidates for removal stand out
+    summary = quality_df.groupby(['Rendering', 'Participant ID']).agg(
+        {'Flagged': 'mean', 'Gaps': 'sum', 'Non Monotonic': 'sum', 'Out Of Range': 'sum', 'Longest Freeze': 'max'})
+    print("Probe data quality per participant:")
+    print(summary.sort_values('Flagged', ascending=False))
+    return quality_df
+
+
+if __name__ == '__main__':
+    main()
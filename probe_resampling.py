@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+from exclusions import mode as exclusion_mode, probe_mask
+from probe_data import load_probe_data, load_trials, position_columns
+
+# Output rate of the uniform grid, in Hz (the logger samples at roughly 10 Hz with jitter)
+rate = 10.0
+
+# Length of the grid in seconds; the comparison phase lasts at most 14000 ms ('Comparison Time' in trials.csv)
+max_duration = 14.0
+
+segment_columns = ['Rendering', 'Participant ID', 'Trial Number', 'Trial Phase']
+
+
+# Interpolate every trial phase onto the same fixed-rate grid starting at the phase onset
+# Returns an index DataFrame (one row per segment) and a contiguous (segments, samples, axes) buffer,
+# padded with NaN after the end of each segment
+def resample_segments(probe_df, rate=rate, duration=max_duration):
+    probe_df = probe_df.sort_values(segment_columns + ['Time'], kind='stable')
+    codes = probe_df.groupby(segment_columns, sort=False).ngroup().to_numpy()
+    n_segments = codes.max() + 1 if len(codes) else 0
+
+    times = probe_df['Time'].to_numpy(dtype=float)
+    values = probe_df[position_columns].to_numpy(dtype=float)
+
+    # Time relative to the onset of each segment
+    first = np.r_[0, np.flatnonzero(np.diff(codes)) + 1]
+    onsets = times[first]
+    relative = times - onsets[codes]
+    durations = np.maximum.reduceat(relative, first) if n_segments else np.empty(0)
+
+    n_samples = int(round(duration * rate)) + 1
+    grid = np.arange(n_samples) / rate
+
+    # np.interp only handles one monotonic series, so every (axis, segment) pair is shifted onto its
+    # own stretch of one long time axis and all of them are interpolated in a single call
+    n_axes = values.shape[1]
+    span = max(duration, relative.max() if len(relative) else 0) + 1.0
+    lanes = codes[None, :] + np.arange(n_axes)[:, None] * n_segments
+    xp = (relative[None, :] + lanes * span).ravel()
+    fp = values.T.ravel()
+    x = (grid[None, :] + np.arange(n_axes * n_segments)[:, None] * span).ravel()
+
+    positions = np.interp(x, xp, fp).reshape(n_axes, n_segments, n_samples)
+    positions = np.ascontiguousarray(positions.transpose(1, 2, 0))
+
+    # Do not extrapolate past the last sample of a segment
+    positions[grid[None, :] > durations[:, None]] = np.nan
+
+    index_df = probe_df.iloc[first][segment_columns].reset_index(drop=True)
+    index_df['Onset'] = onsets
+    index_df['Duration'] = durations
+    index_df['Samples'] = np.bincount(codes, minlength=n_segments)
+    return index_df, positions
+
+
+# Save the index and the buffer into one .npz file
+def save_resampled(index_df, positions, path='probe_resampled.npz', rate=rate):
+    columns = {f'index/{column}': index_df[column].to_numpy() if pd.api.types.is_numeric_dtype(index_df[column])
+               else index_df[column].astype(str).to_numpy(dtype=str) for column in index_df.columns}
+    np.savez_compressed(path, positions=positions, rate=rate, **columns)
+
+
+def load_resampled(path='probe_resampled.npz'):
+    with np.load(path) as data:
+        index_df = pd.DataFrame({key.split('/', 1)[1]: data[key] for key in data.files if key.startswith('index/')})
+        return index_df, data['positions'], float(data['rate'])
+
+
+# Average trajectory of every group, computed as a plain reduction over the buffer
+def mean_trajectories(index_df, positions, by):
+    codes = index_df.groupby(by, sort=True).ngroup().to_numpy()
+    keys = index_df.groupby(by, sort=True).size().index
+
+    valid = ~np.isnan(positions)
+    totals = np.zeros((len(keys),) + positions.shape[1:])
+    counts = np.zeros_like(totals)
+    np.add.at(totals, codes, np.where(valid, positions, 0))
+    np.add.at(counts, codes, valid)
+
+    with np.errstate(invalid='ignore'):
+        return keys, totals / counts
+
+
+def main(output='probe_resampled.npz'):
+    probe_df = load_probe_data()
+    index_df, positions = resample_segments(probe_df)
+
+    # Attach the Condition of each trial so the buffer can be reduced per condition directly
+    trials_df = load_trials()[['Participant ID', 'Trial Number', 'Condition']]
+    index_df = index_df.merge(trials_df, on=['Participant ID', 'Trial Number'], how='left')
+
+    # Trial phases excluded in exclusions.csv stay in the buffer; the mask is stored with the index
+    index_df['Excluded'] = probe_mask(index_df)
+
+    save_resampled(index_df, positions, output)
+
+    print(f'Resampled {len(index_df)} trial phases onto {positions.shape[1]} samples at {rate:g} Hz')
+    kept = (~index_df['Excluded']).to_numpy() if exclusion_mode == 'cleaned' else slice(None)
+    keys, means = mean_trajectories(index_df[kept], positions[kept], ['Rendering', 'Condition', 'Trial Phase'])
+    for key, trajectory in zip(keys, means):
+        print(key, np.nanmean(trajectory, axis=0).round(3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from probe_data import load_probe_data, position_columns
+
+# Probe speed (position units per second) above which the probe counts as moving
+speed_threshold = 0.2
+
+trial_columns = ['Rendering', 'Participant ID', 'Trial Number']
+component_columns = ['Movement Onset', 'Exploration Time', 'Decision Time']
+
+
+# Find the comparison onset, the first movement and the start of the final stationary period of every trial
+# All trials of all participants are handled at once: speeds come from segment-aware differences over the
+# sorted comparison-phase samples and the landmarks are grouped minima and maxima of the moving samples
+def detect_motion_landmarks(probe_df, threshold=speed_threshold):
+    comparison = probe_df[probe_df['Trial Phase'] == 2].reset_index(drop=True)
+
+    # A retried trial is logged twice; keep only its last contiguous run, which belongs to the kept response
+    keys = comparison[trial_columns]
+    new_run = (keys != keys.shift()).any(axis=1).to_numpy()
+    comparison['Run'] = np.cumsum(new_run)
+    comparison = comparison[comparison['Run'] == comparison.groupby(trial_columns)['Run'].transform('max')]
+    comparison = comparison.sort_values(trial_columns + ['Time'], kind='stable')
+
+    same = (comparison[trial_columns].to_numpy()[1:] == comparison[trial_columns].to_numpy()[:-1]).all(axis=1)
+    time = comparison['Time'].to_numpy()
+    step = np.diff(time)
+    distance = np.sqrt((np.diff(comparison[position_columns].to_numpy(), axis=0) ** 2).sum(axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.where(same & (step > 0), distance / step, 0.0)
+
+    # A sample is moving when the step that ends at it is faster than the threshold
+    comparison['Moving Time'] = np.where(np.r_[False, speed > threshold], time, np.nan)
+
+    landmarks = comparison.groupby(trial_columns).agg(
+        **{'Comparison Onset': ('Time', 'min'), 'First Movement': ('Moving Time', 'min'), 'Last Movement': ('Moving Time', 'max')})
+    return landmarks.reset_index()
+
+
+# Split Reaction Time into the latency to the first movement, the exploration until the probe comes to
+# rest for the last time, and the decision time from then until the response
+def decompose_reaction_times(combined_df, landmarks):
+    df = combined_df.merge(landmarks, on=trial_columns, how='left')
+
+    onset = df['First Movement'] - df['Comparison Onset']
+    settle = (df['Last Movement'] - df['Comparison Onset']).clip(upper=df['Reaction Time'])
+
+    df['Movement Onset'] = onset.clip(upper=df['Reaction Time'])
+    df['Exploration Time'] = settle - df['Movement Onset']
+    df['Decision Time'] = df['Reaction Time'] - settle
+    return df.drop(columns=['Comparison Onset', 'First Movement', 'Last Movement'])
+
+
+# Add the reaction time components of one folder to its combined DataFrame
+# participants limits the probe files read to these participant IDs
+def add_reaction_time_components(combined_df, folder, participants=None):
+    landmarks = detect_motion_landmarks(load_probe_data([folder], participants))
+    return decompose_reaction_times(combined_df, landmarks)
+
+
+def main():
+    df = pd.read_csv('combined_results.csv')
+    if not set(component_columns) <= set(df.columns):
+        print("combined_results.csv has no reaction time components, run CombineVRandDesktopResults.py first")
+        return
+
+    # Mean of every component per rendering and condition, next to the full Reaction Time
+    print(df.groupby(['Rendering', 'Condition'])[['Reaction Time'] + component_columns].mean())
+
+    missing = df[component_columns].isna().any(axis=1).groupby(df['Rendering']).sum()
+    print("\nTrials without probe movement data:")
+    print(missing)
+
+
+if __name__ == '__main__':
+    main()
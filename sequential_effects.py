@@ -0,0 +1,120 @@
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+import statsmodels.formula.api as smf
+from statsmodels.tools.sm_exceptions import ConvergenceWarning
+
+from exclusions import apply_exclusions
+from instrumentation import instrument, stage
+
+# A participant's session, in the order the trials were run
+session_columns = ['Rendering', 'Participant ID']
+
+lag_columns = ['Previous Error', 'Previous Condition', 'Condition Switch', 'Previous Reaction Time', 'Trial Position',
+               'Session Time']
+
+# Effects estimated by the trial-level models, next to Rendering * Condition
+sequential_terms = 'Previous_Error + Condition_Switch + Trial_Position'
+
+
+# Lagged columns of every trial, for all participants at once: the trials are sorted once by session and start time
+# and every lag is a grouped shift, so nothing loops over participants. The first trial of a session has no lag (NaN)
+@instrument('aggregate/sequential features')
+def lagged_features(trials_df):
+    df = trials_df.copy()
+    df['Start Timestamp'] = pd.to_datetime(df['Start Timestamp'])
+    df = df.sort_values(session_columns + ['Start Timestamp', 'Trial Number'], kind='stable').reset_index(drop=True)
+    df['Error'] = 1 - df['Correctness'].astype(bool).astype(int)
+
+    sessions = df.groupby(session_columns, sort=False)
+    previous = sessions[['Error', 'Condition', 'Reaction Time']].shift(1)
+    df['Previous Error'] = previous['Error']
+    df['Previous Condition'] = previous['Condition']
+    df['Previous Reaction Time'] = previous['Reaction Time']
+    df['Condition Switch'] = (df['Condition'] != df['Previous Condition']).astype(float).where(df['Previous Condition'].notna())
+
+    df['Trial Position'] = sessions.cumcount() + 1
+    df['Session Time'] = (df['Start Timestamp'] - sessions['Start Timestamp'].transform('min')).dt.total_seconds()
+    return df
+
+
+# Robust post-error slowing (Dutilh et al., 2012): RT after an error minus RT before it, for errors surrounded by
+# correct trials of the same session; the pairs are found with the same lags in both directions
+def post_error_slowing(df):
+    sessions = df.groupby(session_columns, sort=False)
+    before = sessions[['Error', 'Reaction Time']].shift(1)
+    after = sessions[['Error', 'Reaction Time']].shift(-1)
+    pairs = (df['Error'] == 1) & (before['Error'] == 0) & (after['Error'] == 0)
+
+    slowing = df.loc[pairs, session_columns].assign(**{'Post Error Slowing': (after['Reaction Time'] - before['Reaction Time'])[pairs]})
+    return slowing.groupby(session_columns).agg(Errors=('Post Error Slowing', 'size'), **{'Post Error Slowing': ('Post Error Slowing', 'mean')}).reset_index()
+
+
+# Mixed model with a random intercept and a random Condition slope per participant, fitted with the optimizers of
+# interaction_analysis.py (Nelder-Mead, then BFGS) and without the slope when neither converges
+# Returns None, reported as not estimable, when no variant converges, e.g. on a near-singular design
+def fit_mixed_model(formula, data):
+    for re_formula in ['~Condition', None]:
+        model = smf.mixedlm(formula, data, groups=data['Participant_ID'], re_formula=re_formula)
+        for method in ['nm', 'bfgs']:
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter('error', ConvergenceWarning)
+                    # A random effect variance of zero is a valid estimate, not a failure
+                    warnings.filterwarnings('ignore', message='The MLE may be on the boundary', category=ConvergenceWarning)
+                    warnings.filterwarnings('ignore', category=RuntimeWarning)
+                    fit = model.fit(method=method, maxiter=1000, full_output=True)
+            except (np.linalg.LinAlgError, ConvergenceWarning, ValueError) as error:
+                print(f"{formula} (random effects {re_formula or '~1'}, {method}) not estimable: {error}")
+                continue
+            if fit.converged:
+                return fit
+    return None
+
+
+# Trial-level models: a mixed model of log reaction time with a random intercept per participant, and a logit of
+# errors with standard errors clustered by participant
+def sequential_models(df):
+    data = df.dropna(subset=['Previous Error', 'Condition Switch']).copy()
+    data.columns = data.columns.str.replace(' ', '_')
+    data['Log_Reaction_Time'] = np.log(data['Reaction_Time'])
+    # Scale position to blocks of 10 trials so the coefficients are readable
+    data['Trial_Position'] = data['Trial_Position'] / 10
+
+    fits = {}
+    with stage('model/mixedlm sequential reaction time', rows=len(data)):
+        fits['Log Reaction Time'] = fit_mixed_model(f'Log_Reaction_Time ~ Rendering * Condition + {sequential_terms}', data)
+
+    with stage('model/logit sequential error', rows=len(data)):
+        groups = pd.factorize(data['Rendering'] + '/' + data['Participant_ID'].astype(str))[0]
+        model = smf.glm(f'Error ~ Rendering * Condition + {sequential_terms}', data, family=sm.families.Binomial())
+        try:
+            fits['Error'] = model.fit(cov_type='cluster', cov_kwds={'groups': groups})
+        except np.linalg.LinAlgError as error:
+            print(f"Error model not estimable: {error}")
+            fits['Error'] = None
+    return fits
+
+
+def main(path='combined_results.csv'):
+    df = lagged_features(apply_exclusions(pd.read_csv(path), 'trials'))
+
+    print("Mean reaction time and error rate after a correct trial and after an error:")
+    print(df.groupby(['Rendering', 'Previous Error'])[['Reaction Time', 'Error']].mean().round(3))
+    print("\nAfter a condition switch and without one:")
+    print(df.groupby(['Rendering', 'Condition Switch'])[['Reaction Time', 'Error']].mean().round(3))
+
+    slowing = post_error_slowing(df)
+    print("\nRobust post-error slowing per rendering (mean of the participant means, seconds):")
+    print(slowing.groupby('Rendering')['Post Error Slowing'].agg(['count', 'mean', 'std']).round(3))
+
+    for measure, fit in sequential_models(df).items():
+        print(f"\nTrial-level model of {measure}:")
+        print(fit.summary() if fit is not None else "not estimable on this data")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
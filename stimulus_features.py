@@ -0,0 +1,123 @@
+import functools
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from probe_data import load_trials, parse_path
+
+# Complexity of every stimulus: Sample Number identifies the Path/Foil pair, so each feature is computed once per
+# sample from the decoded cells and gathered onto the trials by Sample Number
+feature_columns = ['Path Cells', 'Path Distance', 'Turns', 'Path Extent', 'Straightness', 'Backtracks',
+                   'Foil Divergence Index', 'Foil Differing Cells']
+
+
+# Cells of every sample as one (samples, cells, 2) array, padded with -1 after the end of shorter paths
+def padded_cells(texts):
+    decoded = [parse_path(text) for text in texts]
+    length = max((len(cells) for cells in decoded), default=0)
+    table = np.full((len(decoded), length, 2), -1, dtype=np.int16)
+    for row, cells in enumerate(decoded):
+        table[row, :len(cells)] = cells
+    return table, np.array([len(cells) for cells in decoded])
+
+
+# Features of every path at once; steps after the end of a path are masked out
+def path_features(cells, lengths):
+    n_cells = cells.shape[1]
+    valid = np.arange(n_cells) < lengths[:, None]
+    steps = np.diff(cells, axis=1).astype(float)
+    step_valid = valid[:, 1:]
+    step_lengths = np.where(step_valid, np.sqrt((steps ** 2).sum(axis=2)), 0.0)
+
+    # A turn is a change of direction between two consecutive steps
+    directions = steps / np.where(step_lengths > 0, step_lengths, 1.0)[..., None]
+    turn_valid = step_valid[:, 1:]
+    turns = ((np.abs(directions[:, 1:] - directions[:, :-1]).sum(axis=2) > 1e-9) & turn_valid).sum(axis=1)
+
+    # Backtracking: steps that bring the path closer to where it started
+    start = cells[:, :1].astype(float)
+    from_start = np.sqrt(((cells - start) ** 2).sum(axis=2))
+    backtracks = ((np.diff(from_start, axis=1) < 0) & step_valid).sum(axis=1)
+
+    # Bounding box of the visited cells, in cells
+    masked = np.where(valid[..., None], cells, np.nan)
+    extent = np.nanmax(masked, axis=1) - np.nanmin(masked, axis=1) + 1
+    last = cells[np.arange(len(cells)), lengths - 1].astype(float)
+    distance = step_lengths.sum(axis=1)
+
+    return {
+        'Path Cells': lengths,
+        'Path Distance': distance,
+        'Turns': turns,
+        'Path Extent': (extent[:, 0] * extent[:, 1]).astype(int),
+        'Straightness': np.sqrt(((last - start[:, 0]) ** 2).sum(axis=1)) / np.where(distance > 0, distance, np.nan),
+        'Backtracks': backtracks,
+    }
+
+
+# One row per Sample Number with the features of its Path and where its Foil leaves it
+def feature_table(trials_df):
+    samples = trials_df[['Sample Number', 'Path', 'Foil']].drop_duplicates()
+    if samples['Sample Number'].duplicated().any():
+        raise ValueError(f"Sample Numbers with more than one Path/Foil: {sorted(samples.loc[samples['Sample Number'].duplicated(), 'Sample Number'])}")
+    samples = samples.sort_values('Sample Number').reset_index(drop=True)
+
+    paths, lengths = padded_cells(samples['Path'])
+    foils, _ = padded_cells(samples['Foil'])
+    features = pd.DataFrame(path_features(paths, lengths))
+
+    # 1-based position of the first cell where the Foil differs from the Path (0 when they are the same)
+    width = max(paths.shape[1], foils.shape[1])
+    paths = np.pad(paths, ((0, 0), (0, width - paths.shape[1]), (0, 0)), constant_values=-1)
+    foils = np.pad(foils, ((0, 0), (0, width - foils.shape[1]), (0, 0)), constant_values=-1)
+    differs = (paths != foils).any(axis=2)
+    features['Foil Divergence Index'] = np.where(differs.any(axis=1), differs.argmax(axis=1) + 1, 0)
+    features['Foil Differing Cells'] = differs.sum(axis=1)
+
+    features.insert(0, 'Sample Number', samples['Sample Number'].astype(int))
+    return features[['Sample Number'] + feature_columns]
+
+
+# The table of a trials.csv, rebuilt only when the file changes
+@functools.lru_cache(maxsize=4)
+def _cached_table(path, signature):
+    return feature_table(load_trials(path))
+
+
+def load_features(path='trials.csv'):
+    stat = os.stat(path)
+    return _cached_table(os.path.abspath(path), (stat.st_mtime_ns, stat.st_size)).copy()
+
+
+# Add the features to trial-level data by gathering the rows of the table at the Sample Number of every trial;
+# trials without a known sample get NaN
+def attach_features(df, features=None, sample_column='Sample Number', columns=feature_columns, rename=None):
+    features = load_features() if features is None else features
+    samples = features['Sample Number'].to_numpy()
+    lookup = np.full(samples.max() + 2, -1)
+    lookup[samples] = np.arange(len(features))
+
+    sample_numbers = pd.to_numeric(df[sample_column], errors='coerce').to_numpy(dtype=float)
+    known = ~np.isnan(sample_numbers) & (sample_numbers >= 0) & (sample_numbers <= samples.max())
+    rows = np.full(len(df), -1)
+    rows[known] = lookup[sample_numbers[known].astype(int)]
+
+    values = features[columns].to_numpy(dtype=float)
+    gathered = np.vstack([values, np.full((1, len(columns)), np.nan)])[rows]
+    df = df.copy()
+    for i, column in enumerate(columns):
+        df[rename(column) if rename else column] = gathered[:, i]
+    return df
+
+
+def main(path='trials.csv'):
+    features = load_features(path)
+    print(features.to_string(index=False))
+    print("\nCorrelations between the features:")
+    print(features[feature_columns].corr().round(2))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
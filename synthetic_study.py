@@ -0,0 +1,233 @@
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from probe_data import folders, grid_size, position_columns, probe_columns
+
+# Shape of a session, as recorded: 90 trials in blocks of 5 with the same condition, 9-cell paths
+n_trials = 90
+block_size = 5
+conditions = ['H', 'V', 'VH']
+path_length = 9
+
+# Phase durations and the pause between phases and trials, in seconds
+sample_time = 7.0
+comparison_time = 14.0
+interval = 5.1
+
+# Probe logger rate in Hz
+probe_rate = 10.0
+
+# Accuracy and median reaction time (seconds) per condition and the spread of the reaction times,
+# close to the recorded sessions; VR trials are slightly slower
+accuracy = {'H': 0.63, 'V': 0.79, 'VH': 0.84}
+median_reaction_time = {'H': 9.4, 'V': 8.0, 'VH': 7.7}
+reaction_time_sigma = 0.45
+rendering_slowdown = {'VR': 1.05, 'Desktop': 1.0}
+
+# Share of sessions that crashed and were resumed a few trials back, which logs a run of trials twice,
+# and share of participants whose probe logger wrote nothing but the header
+restart_rate = 0.15
+missing_probe_rate = 0.02
+
+seed = 0
+
+participant_header = 'Participant ID,Trial Number,Response,Correctness, Start Timestamp, End Timestamp'
+
+steps = np.array([(0, 1), (1, 0), (0, -1), (-1, 0)])
+
+
+# Random self-avoiding walk of path_length cells on the grid
+def grid_walk(rng):
+    while True:
+        cells = [tuple(int(x) for x in rng.integers(grid_size, size=2))]
+        while len(cells) < path_length:
+            options = [(cells[-1][0] + dx, cells[-1][1] + dy) for dx, dy in steps]
+            options = [cell for cell in options if 0 <= min(cell) and max(cell) < grid_size and cell not in cells]
+            if not options:
+                break
+            cells.append(options[rng.integers(len(options))])
+        if len(cells) == path_length:
+            return cells
+
+
+# Path and Foil of every sample; the foil cuts one corner of the path the other way round
+def sample_paths(rng, n_samples=n_trials):
+    paths, foils = [], []
+    while len(paths) < n_samples:
+        path = grid_walk(rng)
+        corners = [i for i in range(1, path_length - 1)
+                   if path[i - 1][0] != path[i + 1][0] and path[i - 1][1] != path[i + 1][1]
+                   and (path[i - 1][0] + path[i + 1][0] - path[i][0], path[i - 1][1] + path[i + 1][1] - path[i][1]) not in path]
+        if not corners:
+            continue
+        i = corners[rng.integers(len(corners))]
+        foil = list(path)
+        foil[i] = (path[i - 1][0] + path[i + 1][0] - path[i][0], path[i - 1][1] + path[i + 1][1] - path[i][1])
+        paths.append(path)
+        foils.append(foil)
+    return np.array(paths, dtype=np.int8), np.array(foils, dtype=np.int8)
+
+
+def format_cells(cells):
+    return str([(int(x), int(y)) for x, y in cells])
+
+
+# trials.csv: every participant ID runs all samples in a random order, in blocks with a shuffled condition order
+# Like the recorded study, VR and Desktop participants with the same raw ID share a schedule
+def trial_schedule(participant_ids, paths, foils, rng):
+    n = len(participant_ids)
+    samples = np.argsort(rng.random((n, n_trials)), axis=1) + 1
+
+    blocks = np.tile(np.arange(len(conditions)), n_trials // block_size // len(conditions))
+    block_order = np.take_along_axis(np.broadcast_to(blocks, (n, len(blocks))), np.argsort(rng.random((n, len(blocks))), axis=1), axis=1)
+    condition = np.array(conditions)[np.repeat(block_order, block_size, axis=1)]
+
+    path_text = np.array([format_cells(path) for path in paths])
+    foil_text = np.array([format_cells(foil) for foil in foils])
+    return pd.DataFrame({
+        'Participant ID': np.repeat(participant_ids, n_trials),
+        'Trial Number': np.tile(np.arange(1, n_trials + 1), n),
+        'Sample Number': samples.ravel(),
+        'Sample Order': np.where(rng.random(n * n_trials) < 0.5, 'left', 'right'),
+        'Sample Time': int(sample_time * 1000),
+        'Comparison Time': int(comparison_time * 1000),
+        'Condition': condition.ravel(),
+        'Path': path_text[samples.ravel() - 1],
+        'Foil': foil_text[samples.ravel() - 1],
+    })
+
+
+# Write <folder>/<id>.csv and <folder>/<id>_probedata.csv of one participant
+def participant_session(job):
+    directory, folder, participant, schedule, paths, foils, seed = job
+    rng = np.random.default_rng([seed, folders.index(folder), participant])
+
+    # Trials in the order they were run; a resumed session reruns the trials since the resume point
+    order = np.arange(1, n_trials + 1)
+    resumed = np.zeros(n_trials, dtype=bool)
+    if rng.random() < restart_rate:
+        crash = rng.integers(2, n_trials + 1)
+        resume = max(1, crash - rng.integers(0, 10))
+        order = np.r_[np.arange(1, crash + 1), np.arange(resume, n_trials + 1)]
+        resumed = np.arange(len(order)) == crash
+    runs = schedule.set_index('Trial Number').loc[order].reset_index()
+    n_runs = len(runs)
+
+    condition = runs['Condition'].to_numpy()
+    reaction_time = (np.array([median_reaction_time[c] for c in condition]) * rendering_slowdown[folder]
+                     * rng.lognormal(0, reaction_time_sigma, n_runs))
+    correct = rng.random(n_runs) < np.array([accuracy[c] for c in condition])
+    other_side = np.where(runs['Sample Order'] == 'left', 'right', 'left')
+    response = np.where(correct, runs['Sample Order'], other_side)
+
+    # Application clock (seconds) of the start of every run; a crash adds a few minutes before the resumed run
+    durations = sample_time + interval + reaction_time + interval + rng.uniform(0, 1, n_runs)
+    pauses = np.where(resumed, rng.uniform(60, 300, n_runs), 0)
+    starts = rng.uniform(60, 2000) + np.r_[0, np.cumsum(durations[:-1])] + np.cumsum(pauses)
+    onsets = starts + sample_time + interval
+
+    session_start = pd.Timestamp('2023-08-01 09:00') + pd.Timedelta(days=int(rng.integers(60)), minutes=int(rng.integers(480)))
+    clock = session_start - pd.Timedelta(seconds=starts[0])
+    start_timestamp = (clock + pd.to_timedelta(onsets, unit='s')).strftime('%Y-%m-%d %H:%M:%S.%f').str[:-3]
+    end_timestamp = (clock + pd.to_timedelta(onsets + reaction_time, unit='s')).strftime('%Y-%m-%d %H:%M:%S.%f').str[:-3]
+
+    results_df = pd.DataFrame({
+        'Participant ID': participant,
+        'Trial Number': runs['Trial Number'],
+        'Response': response,
+        'Correctness': np.where(correct, 'true', 'false'),
+        'Start Timestamp': start_timestamp,
+        'End Timestamp': end_timestamp,
+    })
+    with open(os.path.join(directory, folder, f'{participant}.csv'), 'w') as f:
+        f.write(participant_header + '\n')
+        results_df.to_csv(f, header=False, index=False)
+
+    probe_path = os.path.join(directory, folder, f'{participant}_probedata.csv')
+    if rng.random() < missing_probe_rate:
+        pd.DataFrame(columns=probe_columns).to_csv(probe_path, index=False)
+        return len(results_df), 0
+
+    # Two segments per run: the sample phase follows the path, the comparison phase the path or the foil
+    segment_start = np.column_stack([starts, onsets]).ravel()
+    segment_duration = np.column_stack([np.full(n_runs, sample_time), reaction_time]).ravel()
+    cells = np.stack([paths[runs['Sample Number'] - 1], np.where((rng.random(n_runs) < 0.5)[:, None, None],
+                                                                 paths[runs['Sample Number'] - 1], foils[runs['Sample Number'] - 1])], axis=1)
+    cells = cells.reshape(2 * n_runs, path_length, 2).astype(float)
+
+    # The probe rests at the first cell, moves along the cells and rests at the last cell until the phase ends
+    move_start = np.column_stack([np.full(n_runs, 0.05), rng.uniform(0.05, 0.25, n_runs)]).ravel()
+    move_end = np.column_stack([np.full(n_runs, 0.95), rng.uniform(0.7, 0.95, n_runs)]).ravel()
+
+    counts = np.floor(segment_duration * probe_rate).astype(int) + 1
+    segment = np.repeat(np.arange(2 * n_runs), counts)
+    offset = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)) / probe_rate
+    offset = np.minimum(offset + rng.uniform(0, 0.02, len(offset)), segment_duration[segment])
+
+    progress = np.clip((offset / segment_duration[segment] - move_start[segment]) / (move_end[segment] - move_start[segment]), 0, 1)
+    position = progress * (path_length - 1)
+    cell = np.minimum(position.astype(int), path_length - 2)
+    weight = (position - cell)[:, None]
+    grid = cells[segment, cell] * (1 - weight) + cells[segment, cell + 1] * weight
+
+    noise = rng.normal(0, 0.02, (len(segment), 3))
+    probe_df = pd.DataFrame({
+        'Trial Number': np.repeat(runs['Trial Number'].to_numpy(), 2)[segment],
+        'Trial Phase': np.tile([1, 2], n_runs)[segment],
+        'Time': np.round(segment_start[segment] + offset, 3),
+        position_columns[0]: (grid[:, 0] - (grid_size - 1) / 2) * 1.3 + noise[:, 0],
+        position_columns[1]: -0.6 + noise[:, 1],
+        position_columns[2]: (grid[:, 1] - (grid_size - 1) / 2) * 0.8 + 0.2 + noise[:, 2],
+    })
+    probe_df.to_csv(probe_path, index=False, float_format='%.7g')
+    return len(results_df), len(probe_df)
+
+
+# Write a study of the given number of participants, split evenly over VR and Desktop, to directory
+def generate_study(participants, directory, seed=seed, max_workers=None):
+    rng = np.random.default_rng(seed)
+    group_sizes = {'VR': (participants + 1) // 2, 'Desktop': participants // 2}
+    paths, foils = sample_paths(rng)
+
+    trials_df = trial_schedule(np.arange(1, max(group_sizes.values()) + 1), paths, foils, rng)
+    os.makedirs(directory, exist_ok=True)
+    trials_df.to_csv(os.path.join(directory, 'trials.csv'), index=False)
+
+    schedules = dict(tuple(trials_df.groupby('Participant ID')))
+    jobs = []
+    for folder in folders:
+        os.makedirs(os.path.join(directory, folder), exist_ok=True)
+        jobs += [(directory, folder, participant, schedules[participant], paths, foils, seed)
+                 for participant in range(1, group_sizes[folder] + 1)]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        written = list(executor.map(participant_session, jobs, chunksize=max(1, len(jobs) // (4 * (os.cpu_count() or 1)))))
+
+    manifest = {
+        'participants': participants,
+        'seed': seed,
+        'probe_rate': probe_rate,
+        # Block of participant IDs per group to ingest the study with (ANALYSIS_ID_BLOCK)
+        'participants_per_group': max(group_sizes.values()),
+        'result_rows': sum(rows for rows, _ in written),
+        'probe_rows': sum(rows for _, rows in written),
+    }
+    with open(os.path.join(directory, 'study.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def main():
+    participants = int(sys.argv[1]) if len(sys.argv) > 1 else 46
+    directory = sys.argv[2] if len(sys.argv) > 2 else f'synthetic_{participants}'
+    manifest = generate_study(participants, directory)
+    print(f"Wrote {participants} participants, {manifest['result_rows']} result rows and {manifest['probe_rows']} probe rows to {directory}")
+
+
+if __name__ == '__main__':
+    main()
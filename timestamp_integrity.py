@@ -0,0 +1,119 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from CombineVRandDesktopResults import groups, list_result_files
+from instrumentation import instrument
+from probe_data import participant_id
+
+# Checks of the trial timeline of every raw result file, run before the files are combined: trials that start before
+# the previous one ended, reaction times that are negative or out of range, jumps of the clock, trials run out of
+# order and retried trials (which combining keeps only the latest attempt of)
+session_columns = ['Rendering', 'Participant ID']
+
+# Reaction times (End - Start, seconds) outside this range are implausible: faster than a response to the comparison
+# can be, or longer than the sample and comparison phases together (7 s + 14 s in trials.csv)
+min_reaction_time = 0.2
+max_reaction_time = 21.0
+
+# A pause between the end of one trial and the start of the next longer than this (seconds) is a clock jump
+max_gap = 600.0
+
+flag_columns = ['Missing Timestamp', 'Overlap', 'Negative Reaction Time', 'Implausible Reaction Time', 'Clock Jump',
+                'Out Of Order', 'Retry']
+
+nanoseconds = 10 ** 9
+
+
+# Trial Number and the start and end of every attempt in one raw file, as int64 nanoseconds; parsed in a worker
+def read_timeline(job):
+    folder, file = job
+    df = pd.read_csv(file)
+    df.rename(columns=lambda x: x.strip(), inplace=True)
+    start = pd.to_datetime(df['Start Timestamp'], errors='coerce')
+    end = pd.to_datetime(df['End Timestamp'], errors='coerce')
+    return pd.DataFrame({
+        'Rendering': folder,
+        'Participant ID': participant_id(file),
+        'Trial Number': df['Trial Number'].to_numpy(dtype=np.int64),
+        'Start': start.to_numpy(dtype='datetime64[ns]').view(np.int64),
+        'End': end.to_numpy(dtype='datetime64[ns]').view(np.int64),
+        'Missing Timestamp': (start.isna() | end.isna()).to_numpy(),
+    })
+
+
+# Flags of every attempt of every participant in one pass: the attempts are sorted once by participant and start
+# time, and every comparison with the previous attempt is a shifted array masked where the participant changes
+@instrument('ingest/timestamp integrity')
+def check_timelines(timeline_df):
+    df = timeline_df.copy()
+    session = df.groupby(session_columns, sort=False).ngroup().to_numpy()
+    missing = df['Missing Timestamp'].to_numpy()
+    # Attempts without both timestamps go last in their session and take no part in the ordering checks
+    start = np.where(missing, np.iinfo(np.int64).max, df['Start'].to_numpy())
+    order = np.lexsort((df['Trial Number'].to_numpy(), start, session))
+    df = df.iloc[order].reset_index(drop=True)
+
+    session, missing = session[order], missing[order]
+    start, end = df['Start'].to_numpy(), df['End'].to_numpy()
+    trial = df['Trial Number'].to_numpy()
+    timed = ~missing
+    same = np.r_[False, (session[1:] == session[:-1]) & timed[1:] & timed[:-1]]
+
+    reaction_time = np.where(timed, (end - start) / nanoseconds, np.nan)
+    previous_end = np.r_[0, end[:-1]]
+    gap = np.where(same, (start - previous_end) / nanoseconds, np.nan)
+
+    # A block of trials run after a later one shows up once, where the sequence of Trial Numbers steps back
+    previous_trial = np.r_[-1, trial[:-1]]
+    retry = df.duplicated(session_columns + ['Trial Number']).to_numpy()
+
+    df['Reaction Time'] = reaction_time
+    df['Gap'] = gap
+    df['Overlap'] = same & (gap < 0)
+    df['Negative Reaction Time'] = timed & (reaction_time <= 0)
+    df['Implausible Reaction Time'] = timed & (reaction_time > 0) & ((reaction_time < min_reaction_time) | (reaction_time > max_reaction_time))
+    df['Clock Jump'] = same & (gap > max_gap)
+    df['Out Of Order'] = same & (trial < previous_trial) & ~retry
+    df['Retry'] = retry
+    return df
+
+
+# One row per participant: attempts and trials, the number of attempts with every flag, and the largest overlap and gap
+def participant_summary(checked_df):
+    summary = checked_df.groupby(session_columns, sort=True).agg(
+        Attempts=('Trial Number', 'size'), Trials=('Trial Number', 'nunique'),
+        **{column: (column, 'sum') for column in flag_columns},
+        **{'Largest Overlap': ('Gap', lambda gap: max(-gap.min(), 0)), 'Largest Gap': ('Gap', 'max'),
+           'Max Reaction Time': ('Reaction Time', 'max')})
+    summary['Flagged'] = summary[flag_columns].sum(axis=1) > 0
+    return summary.reset_index()
+
+
+def check_raw_files(groups=groups, max_workers=None):
+    jobs = [(folder, file) for folder in groups for file in list_result_files(folder)]
+
+    # One worker per participant file; the checks then run once over all of them
+    with ProcessPoolExecutor(max_workers=max_workers or min(len(jobs), os.cpu_count())) as executor:
+        timelines = list(executor.map(read_timeline, jobs))
+    return check_timelines(pd.concat(timelines, ignore_index=True))
+
+
+def main(groups=groups, output='timestamp_integrity.csv'):
+    checked_df = check_raw_files(groups)
+    summary = participant_summary(checked_df)
+    summary.to_csv(output, index=False)
+
+    print(f"Timestamp integrity of {len(summary)} participants, {summary['Flagged'].sum()} with issues:")
+    print(summary[summary['Flagged']].round(3).to_string(index=False))
+
+    flagged = checked_df[checked_df[flag_columns[:-1]].any(axis=1)]
+    print("\nFlagged attempts (retries not listed):")
+    print(flagged[session_columns + ['Trial Number', 'Reaction Time', 'Gap'] + flag_columns[1:-1]].round(3).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or groups)
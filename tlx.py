@@ -0,0 +1,182 @@
+import glob
+import os
+import re
+import sys
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from exclusions import apply_exclusions
+from instrumentation import instrument
+from probe_data import folders
+
+# LimeSurvey exports of the NASA TLX, one per group; the group is the start of the file name (e.g. VR_Nasa_TLX.csv)
+survey_folder = 'NASA TLX'
+
+tlx_dimensions = ['Mental Demand', 'Physical Demand', 'Temporal Demand', 'Performance', 'Effort', 'Frustration']
+scores = tlx_dimensions + ['Raw TLX', 'Weighted TLX']
+
+# Optional pairwise comparisons for the weighted TLX: files with 'weights' in their name, with Rendering, Participant ID
+# and how often each dimension was chosen out of the 15 pairs. The current exports only contain the ratings
+weights_pattern = '*weights*.csv'
+n_pairs = 15
+
+performance_measures = ['Error Rate', 'Reaction Time']
+
+
+# Column names without the question text, e.g. 'Mental DemandHow mentally demanding was the task?  []' -> 'Mental Demand'
+def normalize_header(header):
+    header = re.sub(r'\s+', ' ', header.replace('﻿', '')).strip()
+    folded = header.replace(' ', '').lower()
+    for name in tlx_dimensions + ['Participant ID']:
+        if folded.startswith(name.replace(' ', '').lower()):
+            return name
+    return header
+
+
+# Group of a survey export: the folder name its file name starts with, in any case
+def survey_group(path, groups=folders):
+    prefix = os.path.basename(path).split('_')[0]
+    return next((group for group in groups if group.lower() == prefix.lower()), prefix)
+
+
+def survey_files(folder=survey_folder):
+    files = sorted(glob.glob(os.path.join(folder, '*.csv')))
+    weights = set(glob.glob(os.path.join(folder, weights_pattern)))
+    return [file for file in files if file not in weights]
+
+
+# Ratings of every export in the folder, one row per response with its Rendering; excluded participants are dropped
+@instrument('ingest/tlx surveys')
+def load_surveys(folder=survey_folder, groups=folders, exclude=True):
+    dfs = []
+    for file in survey_files(folder):
+        # utf-8-sig drops the byte order mark LimeSurvey writes in front of the first header
+        df = pd.read_csv(file, encoding='utf-8-sig')
+        df.columns = [normalize_header(column) for column in df.columns]
+        df.insert(0, 'Rendering', survey_group(file, groups))
+        dfs.append(df)
+    surveys = pd.concat(dfs, ignore_index=True)
+
+    # Ensure all ratings are numeric, all exports at once
+    surveys[tlx_dimensions] = surveys[tlx_dimensions].apply(pd.to_numeric, errors='coerce')
+    surveys['Participant ID'] = pd.to_numeric(surveys['Participant ID'], errors='coerce')
+    if exclude:
+        surveys = apply_exclusions(surveys, 'tlx', participant='Participant ID')
+    return surveys
+
+
+def load_weights(folder=survey_folder):
+    files = glob.glob(os.path.join(folder, weights_pattern))
+    if not files:
+        return None
+    weights = pd.concat([pd.read_csv(file, encoding='utf-8-sig') for file in sorted(files)], ignore_index=True)
+    weights.columns = [normalize_header(column) for column in weights.columns]
+    return weights
+
+
+# Raw TLX (mean of the six ratings) and weighted TLX (ratings weighted by the pairwise comparisons, divided by 15)
+# of every response that has a participant and all ratings
+def tlx_scores(surveys, weights=None):
+    df = surveys.dropna(subset=['Participant ID'] + tlx_dimensions)[['Rendering', 'Participant ID'] + tlx_dimensions].copy()
+    df['Participant ID'] = df['Participant ID'].astype(int)
+    ratings = df[tlx_dimensions].to_numpy(dtype=float)
+    df['Raw TLX'] = ratings.mean(axis=1)
+
+    df['Weighted TLX'] = np.nan
+    if weights is not None:
+        tallies = df[['Rendering', 'Participant ID']].merge(weights[['Rendering', 'Participant ID'] + tlx_dimensions],
+                                                            on=['Rendering', 'Participant ID'], how='left')
+        # Responses without comparisons have NaN tallies and so no weighted score
+        df['Weighted TLX'] = (ratings * tallies[tlx_dimensions].to_numpy(dtype=float)).sum(axis=1) / n_pairs
+    return df.reset_index(drop=True)
+
+
+# Student t-test and Mann-Whitney U of every score between every pair of groups, each pair in one
+# vectorized call over all score columns
+@instrument('test/tlx tests')
+def group_tests(scores_df, columns=scores):
+    columns = [column for column in columns if scores_df[column].notna().any()]
+    present = list(scores_df['Rendering'].unique())
+    rows = []
+    for group_a, group_b in combinations([group for group in folders if group in present] + [group for group in present if group not in folders], 2):
+        a = scores_df.loc[scores_df['Rendering'] == group_a, columns].to_numpy(dtype=float)
+        b = scores_df.loc[scores_df['Rendering'] == group_b, columns].to_numpy(dtype=float)
+        t_test = stats.ttest_ind(a, b, axis=0, nan_policy='omit')
+        u_test = stats.mannwhitneyu(a, b, axis=0, nan_policy='omit')
+        rows.append(pd.DataFrame({
+            'Group A': group_a, 'Group B': group_b, 'Score': columns,
+            'Mean A': np.nanmean(a, axis=0), 'Mean B': np.nanmean(b, axis=0),
+            't-statistic': np.asarray(t_test.statistic), 'p-value': np.asarray(t_test.pvalue),
+            'U': np.asarray(u_test.statistic), 'U p-value': np.asarray(u_test.pvalue),
+        }))
+    return pd.concat(rows, ignore_index=True)
+
+
+# Error rate and mean reaction time of every participant, keyed like the surveys by Rendering and the ID within the group
+def performance(path='combined_results.csv'):
+    df = apply_exclusions(pd.read_csv(path, usecols=['Rendering', 'Source ID', 'Trial Number', 'Start Timestamp',
+                                                     'Correctness', 'Reaction Time']), 'trials')
+    df['Error'] = 1 - df['Correctness'].astype(bool).astype(int)
+    return df.groupby(['Rendering', 'Source ID']).agg(**{
+        'Trials': ('Error', 'size'), 'Error Rate': ('Error', 'mean'), 'Reaction Time': ('Reaction Time', 'mean'),
+    }).reset_index().rename(columns={'Source ID': 'Participant ID'})
+
+
+# Participants with more than one response (e.g. a mistyped Participant ID in the survey)
+def duplicate_responses(scores_df):
+    return scores_df[scores_df.duplicated(['Rendering', 'Participant ID'], keep=False)]
+
+
+# One row per participant with both a response and trials; responses that cannot be told apart are left out
+def join_performance(scores_df, performance_df):
+    scores_df = scores_df.drop_duplicates(['Rendering', 'Participant ID'], keep=False)
+    return scores_df.merge(performance_df, on=['Rendering', 'Participant ID'], how='inner')
+
+
+# Pearson correlations of every workload score with every performance measure, over all groups and within each
+# group; all pairs come from one matrix product of the standardized columns
+@instrument('test/tlx performance')
+def correlations(joined, columns=scores, measures=performance_measures):
+    columns = [column for column in columns if joined[column].notna().any()]
+    rows = []
+    for group, df in [('All', joined)] + list(joined.groupby('Rendering')):
+        df = df.dropna(subset=columns + measures)
+        n = len(df)
+        if n < 3:
+            continue
+        x = df[columns].to_numpy(dtype=float)
+        y = df[measures].to_numpy(dtype=float)
+        zx = (x - x.mean(axis=0)) / x.std(axis=0, ddof=1)
+        zy = (y - y.mean(axis=0)) / y.std(axis=0, ddof=1)
+        r = np.clip(zx.T @ zy / (n - 1), -1, 1)
+        with np.errstate(divide='ignore'):
+            t = r * np.sqrt((n - 2) / (1 - r ** 2))
+        p = 2 * stats.t.sf(np.abs(t), n - 2)
+        score_names, measure_names = np.meshgrid(columns, measures, indexing='ij')
+        rows.append(pd.DataFrame({'Group': group, 'N': n, 'Score': score_names.ravel(), 'Measure': measure_names.ravel(),
+                                  'r': r.ravel(), 'p-value': p.ravel()}))
+    return pd.concat(rows, ignore_index=True)
+
+
+def main(folder=survey_folder):
+    scores_df = tlx_scores(load_surveys(folder), load_weights(folder))
+    print(scores_df.groupby('Rendering')[scores].mean().round(3).to_string())
+
+    print("\nGroup tests:")
+    print(group_tests(scores_df).round(4).to_string(index=False))
+
+    duplicates = duplicate_responses(scores_df)
+    if len(duplicates):
+        print("\nLeft out of the join, more than one response:")
+        print(duplicates[['Rendering', 'Participant ID', 'Raw TLX']].to_string(index=False))
+
+    joined = join_performance(scores_df, performance())
+    print(f"\nWorkload and performance of {len(joined)} participants:")
+    print(correlations(joined).round(4).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
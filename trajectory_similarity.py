@@ -0,0 +1,143 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from probe_data import folders, grid_size, list_probe_files, load_trials, parse_path, participant_id, read_probe_file
+
+# Number of points every trace and polyline is resampled to before the DTW
+n_points = 64
+
+# Sakoe-Chiba band half-width, in resampled points
+window = 8
+
+# Probe axes compared against the grid
+xy_columns = ['Position X', 'Position Y']
+
+
+# Resample a polyline to n equally spaced points along its arc length
+def resample_polyline(xy, n):
+    steps = np.sqrt((np.diff(xy, axis=0) ** 2).sum(axis=1))
+    arc = np.concatenate([[0.0], np.cumsum(steps)])
+    if len(xy) < 2 or arc[-1] == 0:
+        return np.repeat(xy[:1], n, axis=0).astype(float)
+    grid = np.linspace(0, arc[-1], n)
+    return np.column_stack([np.interp(grid, arc, xy[:, axis]) for axis in range(xy.shape[1])])
+
+
+# Turn grid cells into cell-centre coordinates in the unit square
+def cell_centres(cells):
+    return (cells.astype(float) + 0.5) / grid_size
+
+
+# Stretch a trace so that its bounding box matches the box [lo, hi]
+def fit_to_box(xy, lo, hi):
+    xy_min = xy.min(axis=0)
+    extent = xy.max(axis=0) - xy_min
+    extent[extent == 0] = 1
+    return lo + (xy - xy_min) / extent * (hi - lo)
+
+
+# Banded DTW between two batches of equally long sequences, a (B, n, d) and b (B, m, d)
+# The DP is swept one anti-diagonal at a time: every cell on diagonal i + j = k only depends on
+# diagonals k - 1 and k - 2, so a whole diagonal of every pair in the batch is updated in one step
+def banded_dtw(a, b, band=window):
+    batch, n, m = a.shape[0], a.shape[1], b.shape[1]
+    cost = np.sqrt(((a[:, :, None, :] - b[:, None, :, :]) ** 2).sum(axis=-1))
+
+    acc = np.full((batch, n + 1, m + 1), np.inf)
+    acc[:, 0, 0] = 0
+
+    for k in range(2, n + m + 1):
+        i = np.arange(max(1, k - m), min(n, k - 1) + 1)
+        j = k - i
+        # Keep only the cells inside the band around the (scaled) main diagonal
+        inside = np.abs(i * m / n - j) <= band
+        i, j = i[inside], j[inside]
+        if len(i) == 0:
+            continue
+        best = np.minimum(np.minimum(acc[:, i - 1, j], acc[:, i, j - 1]), acc[:, i - 1, j - 1])
+        acc[:, i, j] = cost[:, i - 1, j - 1] + best
+
+    # Normalize by the path length so distances are comparable across trials
+    return acc[:, n, m] / (n + m)
+
+
+# Compute the DTW similarity of every trial of one participant
+def participant_similarity(job):
+    folder, file, trials_df = job
+    probe_df = read_probe_file(file)
+    if probe_df.empty:
+        return pd.DataFrame()
+
+    traces = {key: group[xy_columns].to_numpy() for key, group in probe_df.groupby(['Trial Number', 'Trial Phase'])}
+
+    rows, phase1, phase2, paths, foils, foil_cells = [], [], [], [], [], []
+    for trial in trials_df.itertuples(index=False):
+        key1, key2 = (trial.trial_number, 1), (trial.trial_number, 2)
+        if key1 not in traces or key2 not in traces:
+            continue
+
+        path = cell_centres(parse_path(trial.path))
+        foil = cell_centres(parse_path(trial.foil))
+        lo = np.minimum(path.min(axis=0), foil.min(axis=0))
+        hi = np.maximum(path.max(axis=0), foil.max(axis=0))
+
+        phase1.append(resample_polyline(fit_to_box(traces[key1], lo, hi), n_points))
+        phase2.append(resample_polyline(fit_to_box(traces[key2], lo, hi), n_points))
+        paths.append(resample_polyline(path, n_points))
+        foils.append(resample_polyline(foil, n_points))
+
+        # The cells where the Foil leaves the Path
+        differs = (path != foil).any(axis=1)
+        foil_cells.append(foil[differs] if differs.any() else foil[-1:])
+        rows.append((folder, participant_id(file), trial.trial_number, trial.sample_number))
+
+    if not rows:
+        return pd.DataFrame()
+
+    phase1, phase2 = np.stack(phase1), np.stack(phase2)
+    paths, foils = np.stack(paths), np.stack(foils)
+
+    result = pd.DataFrame(rows, columns=['Rendering', 'Participant ID', 'Trial Number', 'Sample Number'])
+    result['DTW Path Phase 1'] = banded_dtw(phase1, paths)
+    result['DTW Path Phase 2'] = banded_dtw(phase2, paths)
+    result['DTW Foil Phase 2'] = banded_dtw(phase2, foils)
+
+    # Positive when the comparison exploration follows the Path more closely than the Foil
+    result['Foil Divergence'] = result['DTW Foil Phase 2'] - result['DTW Path Phase 2']
+
+    # Closest approach of the comparison exploration to the cells only the Foil visits
+    result['Foil Cell Distance'] = [
+        np.sqrt(((trace[:, None, :] - cells[None, :, :]) ** 2).sum(axis=-1)).min()
+        for trace, cells in zip(phase2, foil_cells)
+    ]
+    return result
+
+
+def main(output='trajectory_similarity.csv', max_workers=None):
+    trials_df = load_trials()
+    trials_df = trials_df.rename(columns={'Trial Number': 'trial_number', 'Sample Number': 'sample_number', 'Path': 'path', 'Foil': 'foil'})
+    trials_by_participant = {pid: group for pid, group in trials_df.groupby('Participant ID')}
+
+    # One job per participant file, each worker handles every trial of its participant in one batch
+    jobs = []
+    for folder in folders:
+        for file in list_probe_files(folder):
+            participant_trials = trials_by_participant.get(participant_id(file))
+            if participant_trials is not None:
+                jobs.append((folder, file, participant_trials[['trial_number', 'sample_number', 'path', 'foil']]))
+
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        results = [df for df in executor.map(participant_similarity, jobs) if not df.empty]
+
+    similarity_df = pd.concat(results, ignore_index=True)
+    similarity_df.to_csv(output, index=False)
+
+    print(similarity_df.groupby('Rendering')[['DTW Path Phase 1', 'DTW Path Phase 2', 'DTW Foil Phase 2', 'Foil Divergence']].mean())
+    return similarity_df
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+from probe_data import folders, load_probe_data, parse_path, position_columns
+
+# Known values of the label columns; fixed categories keep the codes identical across pooled studies, and values
+# not listed here (e.g. a new group) are added after them instead of becoming missing
+label_categories = {
+    'Rendering': folders,
+    'Condition': ['H', 'V', 'VH'],
+    'Response': ['left', 'right'],
+    'Sample Order': ['left', 'right'],
+}
+
+# Narrowest integer type of every integer column; a value outside its range is an error, not a silent wrap-around
+integer_dtypes = {
+    'Participant ID': np.int16,
+    'Source ID': np.int16,
+    'Trial Number': np.uint8,
+    'Sample Number': np.uint8,
+    'Correctness': np.uint8,
+    'Sample Time': np.int32,
+    'Comparison Time': np.int32,
+}
+
+timestamp_columns = ['Start Timestamp', 'End Timestamp']
+path_columns = ['Path', 'Foil']
+
+# Probe streams: positions need no more than float32, Time keeps float64 for millisecond steps late in a session
+probe_dtypes = {
+    'Participant ID': np.int16,
+    'Trial Number': np.uint8,
+    'Trial Phase': np.uint8,
+    **{column: np.float32 for column in position_columns},
+}
+
+
+def label_categorical(series, known):
+    extra = sorted(set(series.dropna().astype(str)) - set(known))
+    return pd.Categorical(series, categories=list(known) + extra)
+
+
+def narrow(series, dtype):
+    info = np.iinfo(dtype)
+    if series.isna().any():
+        raise ValueError(f"{series.name} has missing values and cannot be stored as {np.dtype(dtype).name}")
+    if len(series) and (series.min() < info.min or series.max() > info.max):
+        raise ValueError(f"{series.name} ranges from {series.min()} to {series.max()}, outside {np.dtype(dtype).name}")
+    return series.astype(dtype)
+
+
+# Decode the distinct Path or Foil strings once and spread them over the rows by their category codes
+# Paths shorter than the longest one are padded with -1
+def decode_paths(column):
+    decoded = [parse_path(text) for text in column.cat.categories]
+    length = max((len(cells) for cells in decoded), default=0)
+    table = np.full((len(decoded) + 1, length, 2), -1, dtype=np.int8)
+    for code, cells in enumerate(decoded):
+        table[code, :len(cells)] = cells
+    # Code -1 (a missing path) picks the padding row at the end
+    return table[column.cat.codes.to_numpy()]
+
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / (1024 * 1024)
+
+
+# Compact in-memory form of combined_results.csv: categorical labels, narrow integers, timestamps as int64
+# epoch milliseconds and the Path and Foil cells decoded into int8 arrays of shape (rows, cells, 2)
+class TrialDataset:
+    def __init__(self, df):
+        df = df.copy()
+        for column, categories in label_categories.items():
+            if column in df:
+                df[column] = label_categorical(df[column], categories)
+        for column, dtype in integer_dtypes.items():
+            if column in df:
+                df[column] = narrow(df[column], dtype)
+        for column in timestamp_columns:
+            if column in df and not pd.api.types.is_integer_dtype(df[column]):
+                df[column] = pd.to_datetime(df[column]).dt.as_unit('ms').astype(np.int64)
+
+        self.paths = {}
+        for column in path_columns:
+            if column in df:
+                df[column] = df[column].astype('category')
+                self.paths[column] = decode_paths(df[column])
+        self.df = df
+
+    @classmethod
+    def from_csv(cls, path='combined_results.csv'):
+        return cls(pd.read_csv(path))
+
+    def __len__(self):
+        return len(self.df)
+
+    def memory_usage(self):
+        return memory_mb(self.df) + sum(cells.nbytes for cells in self.paths.values()) / (1024 * 1024)
+
+    # Timestamps back as datetimes, e.g. to compute durations
+    def timestamps(self, column='Start Timestamp'):
+        return pd.to_datetime(self.df[column], unit='ms')
+
+    # The DataFrame in the types the analysis scripts read from the CSV
+    def to_frame(self):
+        df = self.df.copy()
+        for column in label_categories:
+            if column in df:
+                df[column] = df[column].astype(str)
+        for column in path_columns:
+            if column in df:
+                df[column] = df[column].astype(str)
+        for column in timestamp_columns:
+            if column in df:
+                df[column] = self.timestamps(column).dt.strftime('%Y-%m-%d %H:%M:%S.%f').str[:-3]
+        if 'Correctness' in df:
+            df['Correctness'] = df['Correctness'].astype(bool)
+        return df
+
+
+# Pad decoded paths with -1 up to length cells
+def pad_paths(cells, length):
+    return np.pad(cells, ((0, 0), (0, length - cells.shape[1]), (0, 0)), constant_values=-1)
+
+
+# Pool several studies into one dataset; the label, Path and Foil categories of the studies are merged and paths
+# of studies with shorter paths are padded to the longest
+def concat_datasets(datasets):
+    frames = [dataset.df for dataset in datasets]
+    df = pd.concat(frames, ignore_index=True)
+    for column in list(label_categories) + path_columns:
+        if column in df:
+            df[column] = pd.api.types.union_categoricals([frame[column] for frame in frames])
+    pooled = TrialDataset.__new__(TrialDataset)
+    pooled.df = df
+    pooled.paths = {}
+    for column in path_columns:
+        if column in df:
+            length = max(dataset.paths[column].shape[1] for dataset in datasets)
+            pooled.paths[column] = np.concatenate([pad_paths(dataset.paths[column], length) for dataset in datasets])
+    return pooled
+
+
+# Narrow the probe streams returned by load_probe_data
+def compact_probe(probe_df):
+    probe_df = probe_df.copy()
+    probe_df['Rendering'] = label_categorical(probe_df['Rendering'], label_categories['Rendering'])
+    for column, dtype in probe_dtypes.items():
+        probe_df[column] = narrow(probe_df[column], dtype) if np.issubdtype(dtype, np.integer) else probe_df[column].astype(dtype)
+    return probe_df
+
+
+def main(path='combined_results.csv'):
+    df = pd.read_csv(path)
+    dataset = TrialDataset(df)
+    print(f"{path}: {len(df)} rows, {memory_mb(df):.2f} MB as read, {dataset.memory_usage():.2f} MB compact")
+
+    per_column = pd.DataFrame({'As Read': df.memory_usage(deep=True, index=False), 'Compact': dataset.df.memory_usage(deep=True, index=False)}) / 1024
+    print("\nMemory per column (KB):")
+    print(per_column.round(1).to_string())
+    for column, cells in dataset.paths.items():
+        print(f"{column} cells: {cells.shape} int8, {cells.nbytes / 1024:.1f} KB")
+
+    probe_df = load_probe_data()
+    compact = compact_probe(probe_df)
+    print(f"\nProbe data: {len(probe_df)} rows, {memory_mb(probe_df):.2f} MB as read, {memory_mb(compact):.2f} MB compact")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,182 @@
+import os
+import sqlite3
+import sys
+import tempfile
+from collections.abc import Iterable
+
+import numpy as np
+import pandas as pd
+
+from probe_data import load_probe_data, position_columns
+
+# Local SQLite file written after ingest; nothing else needs to be running to query it
+store_path = 'trials.sqlite'
+
+# Indexes of every table, by name
+indexes = {
+    'trials': {
+        'trials_participant_trial': ['Participant_ID', 'Trial_Number'],
+        'trials_condition_rendering': ['Condition', 'Rendering'],
+        'trials_sample_number': ['Sample_Number'],
+    },
+    'probe_segments': {
+        'probe_segments_participant_trial': ['Participant_ID', 'Trial_Number', 'Trial_Phase'],
+    },
+    'trajectory_similarity': {
+        'trajectory_similarity_participant_trial': ['Participant_ID', 'Trial_Number'],
+    },
+    'probe_quality': {
+        'probe_quality_participant_trial': ['Participant_ID', 'Trial_Number', 'Trial_Phase'],
+    },
+}
+
+# Per-trial probe outputs of the other scripts, loaded into the store when they have been computed
+feature_files = {
+    'trajectory_similarity': 'trajectory_similarity.csv',
+    'probe_quality': 'probe_quality.csv',
+}
+
+segment_columns = ['Rendering', 'Participant ID', 'Trial Number', 'Trial Phase']
+
+
+def sql_columns(df):
+    return df.rename(columns=lambda x: x.strip().replace(' ', '_'))
+
+
+# Probe tables carry the participant ID within their group; give them the Participant ID of the trials as well
+def combined_ids(df, id_map):
+    df = df.rename(columns={'Participant ID': 'Source ID'})
+    return id_map.merge(df, on=['Rendering', 'Source ID'], how='right')
+
+
+# Samples, onset, duration, path length and mean speed of every trial phase of the probe streams
+def segment_features(probe_df):
+    probe_df = probe_df.sort_values(segment_columns + ['Time'], kind='stable')
+    codes = probe_df.groupby(segment_columns, sort=False).ngroup().to_numpy()
+    steps = np.sqrt((np.diff(probe_df[position_columns].to_numpy(), axis=0) ** 2).sum(axis=1))
+    steps = np.r_[0.0, np.where(codes[1:] == codes[:-1], steps, 0.0)]
+
+    features = probe_df.assign(Step=steps).groupby(segment_columns, sort=False).agg(
+        Samples=('Time', 'size'), Onset=('Time', 'min'), End=('Time', 'max'), **{'Path Length': ('Step', 'sum')}).reset_index()
+    features['Duration'] = features.pop('End') - features['Onset']
+    features['Mean Speed'] = features['Path Length'] / features['Duration'].where(features['Duration'] > 0)
+    return features
+
+
+# Write the trials, the probe segment features and any per-trial probe outputs into a new store
+# The store is built next to its destination and moved into place, so readers never see a half-written file
+def build_store(path=store_path, combined_path='combined_results.csv'):
+    trials_df = pd.read_csv(combined_path)
+    id_map = trials_df[['Participant ID', 'Rendering', 'Source ID']].drop_duplicates()
+
+    tables = {'trials': sql_columns(trials_df)}
+    tables['probe_segments'] = sql_columns(combined_ids(segment_features(load_probe_data()), id_map))
+    for table, file in feature_files.items():
+        if os.path.exists(file):
+            tables[table] = sql_columns(combined_ids(pd.read_csv(file), id_map))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.sqlite', delete=False) as tmp:
+        tmp_path = tmp.name
+    try:
+        with sqlite3.connect(tmp_path) as connection:
+            for table, df in tables.items():
+                df.to_sql(table, connection, index=False, chunksize=10000)
+                for name, columns in indexes.get(table, {}).items():
+                    connection.execute(f'CREATE INDEX {name} ON {table} ({", ".join(columns)})')
+            # Statistics for the query planner
+            connection.execute('ANALYZE')
+        connection.close()
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return {table: len(df) for table, df in tables.items()}
+
+
+# Read-only queries against the store, returned as DataFrames
+class TrialStore:
+    def __init__(self, path=store_path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} does not exist, build it with trial_store.py first")
+        self.connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def query(self, sql, params=()):
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+    # How SQLite runs a query, to check that it uses an index instead of scanning the table
+    def explain(self, sql, params=()):
+        return self.query(f'EXPLAIN QUERY PLAN {sql}', params)['detail'].tolist()
+
+    def tables(self):
+        return self.query("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")['name'].tolist()
+
+    # Trials matching all of the given filters; lists select any of their values
+    def trials(self, participant=None, trial=None, rendering=None, condition=None, sample_number=None,
+               min_reaction_time=None, max_reaction_time=None, columns='*'):
+        sql, params = where_clause({
+            'Participant_ID': participant, 'Trial_Number': trial, 'Rendering': rendering,
+            'Condition': condition, 'Sample_Number': sample_number,
+        }, min_reaction_time, max_reaction_time)
+        return self.query(f'SELECT {columns} FROM trials{sql}', params)
+
+    # Trials matching the filters of trials(), joined with the probe features of one trial phase
+    def trials_with_probe(self, phase=2, participant=None, trial=None, rendering=None, condition=None, sample_number=None,
+                          min_reaction_time=None, max_reaction_time=None):
+        sql, params = where_clause({
+            't.Participant_ID': participant, 't.Trial_Number': trial, 't.Rendering': rendering,
+            't.Condition': condition, 't.Sample_Number': sample_number,
+        }, min_reaction_time, max_reaction_time, prefix='t.')
+        return self.query(
+            'SELECT t.*, p.Samples, p.Onset, p.Duration, p.Path_Length, p.Mean_Speed FROM trials t '
+            'LEFT JOIN probe_segments p ON p.Participant_ID = t.Participant_ID AND p.Trial_Number = t.Trial_Number '
+            f'AND p.Trial_Phase = ?{sql}', [phase] + params)
+
+
+# Python value of a filter for sqlite3, which cannot bind numpy scalars (e.g. an ID taken from a DataFrame)
+def sql_value(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+# WHERE clause with placeholders for the non-empty filters; a filter that is a list, array or Series matches any of
+# its values
+def where_clause(filters, min_reaction_time=None, max_reaction_time=None, prefix=''):
+    conditions, params = [], []
+    for column, value in filters.items():
+        if value is None:
+            continue
+        values = list(value) if isinstance(value, Iterable) and not isinstance(value, (str, bytes)) else [value]
+        conditions.append(f'{column} IN ({", ".join("?" * len(values))})')
+        params.extend(sql_value(v) for v in values)
+    if min_reaction_time is not None:
+        conditions.append(f'{prefix}Reaction_Time > ?')
+        params.append(sql_value(min_reaction_time))
+    if max_reaction_time is not None:
+        conditions.append(f'{prefix}Reaction_Time < ?')
+        params.append(sql_value(max_reaction_time))
+    return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+
+def main():
+    if '--query-only' not in sys.argv:
+        for table, rows in build_store().items():
+            print(f"{table}: {rows} rows")
+
+    with TrialStore() as store:
+        trials = store.trials(rendering='VR', condition='VH', sample_number=28, min_reaction_time=10)
+        print("\nVH trials in VR for Sample Number 28 with a reaction time over 10 s:")
+        print(trials[['Participant_ID', 'Trial_Number', 'Reaction_Time', 'Correctness']])
+        print(store.explain('SELECT * FROM trials WHERE Rendering = ? AND Condition = ? AND Sample_Number = ?', ('VR', 'VH', 28)))
+
+
+if __name__ == '__main__':
+    main()
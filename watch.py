@@ -0,0 +1,173 @@
+import os
+import sys
+import time
+import traceback
+
+import pandas as pd
+
+import pipeline
+from CombineVRandDesktopResults import assign_participant_ids, combine_folder, groups, list_result_files, write_combined
+from online_statistics import OnlineDescriptives, state_path as statistics_path, sync
+from probe_data import participant_id
+
+# Seconds between two scans of the folders
+poll_interval = 1.0
+
+# A participant is processed once none of its changed files has changed for this many seconds,
+# so that files still being written are not read half way
+settle_time = 2.0
+
+# Times a participant whose files look half written is retried before it is left out until its files change again
+max_attempts = 5
+
+combined_path = 'combined_results.csv'
+
+# Pipeline stages kept up to date while watching; they are cheap to redo for every new participant. The analyses,
+# models and figures are left to an explicit run of pipeline.py
+watched_stages = ['ingest', 'store']
+
+
+# Size and modification time of every participant file ('<id>.csv' and '<id>_probedata.csv') in the folders
+def snapshot(folders=groups):
+    files = {}
+    for folder in folders:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith('.csv') and entry.name.split('_')[0].split('.')[0].isdigit():
+                    stat = entry.stat()
+                    files[f'{folder}/{entry.name}'] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+# Files that are new, changed or gone between two snapshots
+def changed_files(previous, current):
+    return {path for path in previous.keys() | current.keys() if previous.get(path) != current.get(path)}
+
+
+# Whether a file of the participant looks half written: empty, no more than a header, or cut off within a line
+def partially_written(folder, participant):
+    for path in [f'{folder}/{participant}.csv', f'{folder}/{participant}_probedata.csv']:
+        if not os.path.exists(path):
+            continue
+        if os.path.getsize(path) == 0:
+            return True
+        with open(path, 'rb') as f:
+            f.readline()
+            if not f.readline():
+                return True
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                return True
+    return False
+
+
+def participant_key(path):
+    folder, name = path.split('/')
+    return folder, participant_id(name)
+
+
+# Replace the rows of the changed participants in combined_results.csv; the rows of everybody else are kept
+# as they are, and participants whose result file is gone (e.g. moved to removed/) lose their rows
+def update_combined(changed, path=combined_path):
+    combined_df = pd.read_csv(path, parse_dates=['Start Timestamp', 'End Timestamp'], float_precision='round_trip')
+
+    shards = []
+    for group in groups:
+        shard = combined_df[combined_df['Rendering'] == group]
+        participants = changed.get(group, set())
+        if participants:
+            shard = shard[~shard['Source ID'].isin(participants)]
+            files = [file for file in list_result_files(group) if participant_id(file) in participants]
+            if files:
+                # Same order as a full ingest: by participant, then trial
+                shard = pd.concat([shard, combine_folder(group, files)]).sort_values(['Source ID', 'Trial Number'], kind='stable')
+        shards.append(shard)
+
+    write_combined(assign_participant_ids(pd.concat(shards, ignore_index=True)), path)
+
+
+# Bring the running descriptives in line with the folders; only the changed participants are read
+def update_statistics():
+    descriptives = OnlineDescriptives.load(statistics_path) if os.path.exists(statistics_path) else OnlineDescriptives()
+    added, retracted = sync(descriptives)
+    descriptives.save(statistics_path)
+    return descriptives, added, retracted
+
+
+def run_watched_stages():
+    return pipeline.run([stage for stage in pipeline.stages if stage['name'] in watched_stages])
+
+
+# Update the combined rows and running statistics of the changed participants, then the trial store
+def process(changed):
+    update_combined(changed)
+    descriptives, added, retracted = update_statistics()
+    print(f"Added {len(added)} and retracted {len(retracted)} participants")
+    print(descriptives.descriptives().round(3).to_string(index=False))
+
+    # combined_results.csv now matches the participant files, so ingest does not have to run again
+    pipeline.mark_current(['ingest'])
+    status = run_watched_stages()
+    print("Run pipeline.py to bring the analyses and figures up to date")
+    return status
+
+
+def watch(interval=poll_interval, settle=settle_time):
+    # Start from an up-to-date combined table and trial store
+    run_watched_stages()
+    update_statistics()
+
+    files = snapshot()
+    pending = {}
+    attempts = {}
+    print(f"Watching {', '.join(groups)} for participant files")
+    try:
+        while True:
+            time.sleep(interval)
+            current = snapshot()
+            now = time.monotonic()
+            for path in changed_files(files, current):
+                pending[participant_key(path)] = now
+                attempts.pop(participant_key(path), None)
+            files = current
+
+            ready = {key for key, changed_at in pending.items() if now - changed_at >= settle}
+            if not ready:
+                continue
+
+            changed = {}
+            for folder, participant in sorted(ready):
+                changed.setdefault(folder, set()).add(participant)
+                del pending[(folder, participant)]
+            print(f"Updating {', '.join(f'{folder}/{participant}' for folder, participant in sorted(ready))}")
+            try:
+                process(changed)
+            except (pd.errors.ParserError, pd.errors.EmptyDataError, KeyError, ValueError):
+                traceback.print_exc()
+                partial = {key for key in ready if partially_written(*key)}
+                if not partial:
+                    # Complete files that cannot be combined are a problem of the data or the code, not of timing
+                    print("The participant files are complete, not retrying until they change")
+                    continue
+                # Files still being written: try again once they have settled, a limited number of times, together
+                # with the other participants of this update
+                for key in ready - partial:
+                    pending[key] = time.monotonic()
+                for key in sorted(partial):
+                    attempts[key] = attempts.get(key, 0) + 1
+                    if attempts[key] > max_attempts:
+                        print(f"Giving up on {key[0]}/{key[1]} after {max_attempts} attempts, its files look half written")
+                        continue
+                    print(f"{key[0]}/{key[1]} looks half written, retrying (attempt {attempts[key]} of {max_attempts})")
+                    pending[key] = time.monotonic()
+    except KeyboardInterrupt:
+        print("Stopped watching")
+
+
+def main():
+    interval = float(sys.argv[1]) if len(sys.argv) > 1 else poll_interval
+    watch(interval)
+
+
+if __name__ == '__main__':
+    main()